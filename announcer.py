@@ -0,0 +1,357 @@
+import sys
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from moves import MoveEvent, MoveTracker
+
+# Lower numbers are spoken first.
+PRIORITY_RESULT = 0
+PRIORITY_MOVE = 1
+PRIORITY_STATUS = 2
+
+COLOR_NAMES = {'R': 'Red', 'Y': 'Yellow'}
+
+
+class Announcement(NamedTuple):
+    """
+    A message waiting to be spoken.
+
+    Attributes
+    ----------
+    priority : int
+        The priority of the message, lower is spoken first.
+    sequence : int
+        The order the message was queued in, used to speak messages of equal priority in order.
+    text : str
+        The message.
+    key : str
+        Messages with the same key are coalesced while they wait, or None.
+    """
+    priority: int
+    sequence: int
+    text: str
+    key: Optional[str]
+
+
+def move_message(event: MoveEvent) -> str:
+    """
+    Returns the message for a move, with columns numbered from 1 as players count them.
+    """
+    return '%s played column %d' % (COLOR_NAMES.get(event.color, event.color), event.column + 1)
+
+
+def winner_message(color: str) -> str:
+    """
+    Returns the message for a win.
+    """
+    return '%s wins' % COLOR_NAMES.get(color, color)
+
+
+class StdoutSink:
+    """
+    Prints each message on its own line, to stdout unless another stream is given.
+    """
+
+    def __init__(self, stream=None) -> None:
+        self.stream = stream
+
+    def speak(self, text: str) -> None:
+        print(text, file=self.stream or sys.stdout, flush=True)
+
+    def close(self) -> None:
+        pass
+
+
+class ListSink:
+    """
+    Keeps every message in a list, for tests and for checking what would have been spoken.
+
+    Attributes
+    ----------
+    messages : list of str
+        The messages in the order they were spoken.
+    delay : float
+        The time each message takes to speak in seconds, to simulate a slow sink.
+    """
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.messages: List[str] = []
+        self.delay = delay
+        self.condition = threading.Condition()
+
+    def speak(self, text: str) -> None:
+        if self.delay > 0:
+            time.sleep(self.delay)
+        with self.condition:
+            self.messages.append(text)
+            self.condition.notify_all()
+
+    def wait(self, count: int, timeout: float = 1.0) -> bool:
+        """
+        Waits until count messages have been spoken, returning False on timeout.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self.messages) >= count, timeout)
+
+    def close(self) -> None:
+        pass
+
+
+class SpeechSink:
+    """
+    Speaks each message with the local text to speech engine of pyttsx3.
+
+    pyttsx3 is an optional dependency. It is imported, and the engine is created, on the first
+    message, which is spoken on the announcer thread as some engines must be used from the
+    thread that created them.
+
+    Attributes
+    ----------
+    rate : int
+        The speaking rate in words per minute, or None for the engine default.
+    """
+
+    def __init__(self, rate: Optional[int] = None) -> None:
+        self.rate = rate
+        self.engine = None
+
+    def speak(self, text: str) -> None:
+        if self.engine is None:
+            import pyttsx3
+            self.engine = pyttsx3.init()
+            if self.rate is not None:
+                self.engine.setProperty('rate', self.rate)
+        self.engine.say(text)
+        self.engine.runAndWait()
+
+    def close(self) -> None:
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
+
+
+def make_sink(name: str):
+    """
+    Returns the sink called 'speech', 'stdout' or 'list'.
+    """
+    sinks = {'speech': SpeechSink, 'stdout': StdoutSink, 'list': ListSink}
+    if name not in sinks:
+        raise ValueError('Unknown announcement sink: %s' % name)
+    return sinks[name]()
+
+
+class Announcer:
+    """
+    Turns board changes into spoken messages without slowing down detection.
+
+    Messages are queued by the detection loop and spoken by a sink on a background thread, so
+    announce() and update() never wait on speech. While messages wait they are coalesced: a
+    message with the same key as a waiting one replaces it, and moves made faster than they can
+    be spoken are joined into one message. The highest priority message is spoken first, and when
+    more than max_pending are waiting the lowest priority one is dropped.
+
+    The moves of a detector that does not track them itself are followed from its boards, and a
+    board is only taken once it has been detected for stable_frames frames in a row, so a disc
+    misread in a single frame is never announced. A board that is not a legal move from the last
+    one, such as two moves made while a hand covered the board, is taken once it has been stable
+    for resync_frames frames.
+
+    Attributes
+    ----------
+    sink : object
+        The object whose speak(text) method outputs each message.
+    max_pending : int
+        The maximum number of messages waiting to be spoken.
+    stable_frames : int
+        The number of frames in a row a board must be detected in before its moves are announced.
+    resync_frames : int
+        The number of frames in a row a board that is not a legal move must be detected in before
+        it is taken.
+    spoken : int
+        The number of messages passed to the sink.
+    coalesced : int
+        The number of messages merged into or replaced by a later one.
+    dropped : int
+        The number of messages dropped because too many were waiting.
+    errors : int
+        The number of messages the sink failed to speak.
+
+    Methods
+    -------
+    start()
+        Starts the announcer thread.
+    stop(timeout=None)
+        Speaks the waiting messages, then stops the thread and closes the sink.
+    announce(text, priority=PRIORITY_STATUS, key=None)
+        Queues a message.
+    announce_move(event)
+        Queues the message for a move.
+    update(connect4)
+        Queues the messages for the moves and result of the latest detection.
+    """
+
+    def __init__(self, sink=None, max_pending: int = 8, first: Optional[str] = None, stable_frames: int = 3,
+                 resync_frames: int = 30) -> None:
+        """
+        Initializes the announcer.
+
+        Parameters
+        ----------
+        sink : object, optional
+            The object whose speak(text) method outputs each message. Default is a StdoutSink.
+        max_pending : int, optional
+            The maximum number of messages waiting to be spoken. Default is 8.
+        first : str, optional
+            The player that moves first, used to follow the moves of a detector that does not
+            track them itself. Default is None, either may start.
+        stable_frames : int, optional
+            The number of frames in a row a board must be detected in before its moves are
+            announced. Default is 3.
+        resync_frames : int, optional
+            The number of frames in a row a board that is not a legal move must be detected in
+            before it is taken. Default is 30.
+        """
+        self.sink = sink if sink is not None else StdoutSink()
+        self.max_pending = max_pending
+        self.pending: List[Announcement] = []
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.sequence = 0
+        self.spoken = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.errors = 0
+        self.stable_frames = stable_frames
+        self.resync_frames = resync_frames
+        self.tracker = MoveTracker(first)
+        self.candidate = None
+        self.candidate_frames = 0
+        self.winner = None
+        self.pieces = 0
+
+    def start(self) -> 'Announcer':
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self.speak_loop, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        self.sink.close()
+
+    def __enter__(self) -> 'Announcer':
+        return self.start()
+
+    def __exit__(self, *exc) -> bool:
+        self.stop()
+        return False
+
+    def announce(self, text: str, priority: int = PRIORITY_STATUS, key: Optional[str] = None,
+                 merge: bool = False) -> None:
+        """
+        Queues a message. Never blocks on speech.
+
+        Parameters
+        ----------
+        text : str
+            The message.
+        priority : int, optional
+            The priority of the message, lower is spoken first. Default is PRIORITY_STATUS.
+        key : str, optional
+            A waiting message with the same key is replaced by this one. Default is None.
+        merge : bool, optional
+            If True, a waiting message with the same key is extended with this one instead of
+            replaced. Default is False.
+        """
+        with self.condition:
+            if key is not None:
+                for idx, waiting in enumerate(self.pending):
+                    if waiting.key == key:
+                        if merge:
+                            text = waiting.text + ', ' + text
+                        self.pending[idx] = waiting._replace(text=text, priority=min(priority, waiting.priority))
+                        self.coalesced += 1
+                        return
+            self.pending.append(Announcement(priority, self.sequence, text, key))
+            self.sequence += 1
+            if len(self.pending) > self.max_pending:
+                self.pending.remove(max(self.pending))
+                self.dropped += 1
+            self.condition.notify()
+
+    def announce_move(self, event: MoveEvent) -> None:
+        self.announce(move_message(event), PRIORITY_MOVE, key='moves', merge=True)
+
+    def update(self, connect4) -> None:
+        """
+        Queues the messages for the latest detection of a Connect4 object: each new move, a new
+        game when the board is emptied, and the winner.
+        """
+        if connect4.incremental:
+            board = connect4.board
+            events = connect4.move_events
+        else:
+            events = self.follow(connect4.board, connect4.frame_index)
+            board = self.tracker.board
+            if board is None:
+                return
+        pieces = int(np.count_nonzero(board != 'O'))
+        if pieces == 0 and self.pieces:
+            self.announce('New game', PRIORITY_STATUS, key='status')
+        self.pieces = pieces
+        for event in events:
+            self.announce_move(event)
+
+        winner = connect4.check_winner(board)
+        if winner != self.winner:
+            self.winner = winner
+            if winner is not None:
+                # Joined onto any moves still waiting, so the winning move is heard first
+                self.announce(winner_message(winner), PRIORITY_RESULT, key='moves', merge=True)
+
+    def follow(self, board: np.ndarray, frame_index: int) -> List[MoveEvent]:
+        """
+        Follows the moves of a detector that does not track them itself, taking a board only once
+        it has been stable, and returns the moves it adds.
+        """
+        if self.tracker.board is not None and np.array_equal(board, self.tracker.board):
+            self.candidate, self.candidate_frames = None, 0
+            return []
+        if self.candidate is not None and np.array_equal(board, self.candidate):
+            self.candidate_frames += 1
+        else:
+            self.candidate, self.candidate_frames = np.array(board), 1
+        if self.candidate_frames < self.stable_frames:
+            return []
+        return self.tracker.update(board, frame_index, resync=self.candidate_frames >= self.resync_frames)
+
+    def next_announcement(self) -> Optional[Announcement]:
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending or not self.running)
+            if not self.pending:
+                return None
+            announcement = min(self.pending)
+            self.pending.remove(announcement)
+            return announcement
+
+    def speak_loop(self) -> None:
+        while True:
+            announcement = self.next_announcement()
+            if announcement is None:
+                return
+            try:
+                self.sink.speak(announcement.text)
+                self.spoken += 1
+            except Exception:
+                # A failing sink must not stop later announcements
+                self.errors += 1
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from connect4 import Connect4
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Each worker process keeps its own detector between items.
+_connect4 = None
+
+
+def init_worker(connect4_args: dict) -> None:
+    """
+    Creates the Connect4 object of a worker process.
+    """
+    global _connect4
+    _connect4 = Connect4(**connect4_args)
+
+
+def detect_item(item: Tuple[int, str, Optional[int], Optional[np.ndarray]]) -> dict:
+    """
+    Runs Connect4.from_image on one image or video frame and returns its JSON record.
+
+    Parameters
+    ----------
+    item : tuple
+        The input index, the source path, the frame index within a video or None for an image,
+        and the decoded frame or None if the worker should read the image itself.
+
+    Returns
+    -------
+    dict
+        The record with the board, circles, winner, timings and error of the item.
+    """
+    index, source, frame_index, frame = item
+    record = {'index': index, 'source': source, 'frame': frame_index, 'board': None,
+              'circles': None, 'winner': None, 'timings': {}, 'error': None}
+    start = time.perf_counter()
+    if frame is None:
+        frame = cv2.imread(source)
+        record['timings']['decode'] = time.perf_counter() - start
+        if frame is None:
+            record['error'] = 'Could not read image!'
+            return record
+
+    start = time.perf_counter()
+    try:
+        _connect4.from_image(frame)
+        record['board'] = _connect4.board.tolist()
+        record['circles'] = [[float(v) for v in circle] for circle in _connect4.circles]
+        record['winner'] = _connect4.check_winner()
+    except ValueError as e:
+        record['error'] = str(e)
+    record['timings']['detect'] = time.perf_counter() - start
+    return record
+
+
+def image_items(directory: str) -> Iterator[Tuple[int, str, None, None]]:
+    """
+    Yields the images of a directory in name order. The images are decoded by the workers.
+    """
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+    for index, name in enumerate(names):
+        yield index, os.path.join(directory, name), None, None
+
+
+def video_items(path: str) -> Iterator[Tuple[int, str, int, np.ndarray]]:
+    """
+    Yields the decoded frames of a video file one at a time.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError('Could not open video!')
+    try:
+        index = 0
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            yield index, path, index, frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def chunked(items: Iterator, size: int) -> Iterator[List]:
+    """
+    Groups items into lists of at most size items.
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(path: str, output, workers: Optional[int] = None, chunk_size: int = 64,
+              connect4_args: Optional[dict] = None) -> int:
+    """
+    Runs detection over a directory of images or a video file and writes JSON Lines records.
+
+    Inputs are read in chunks, so at most chunk_size decoded frames are held at once, and the
+    records are written in input order as each chunk finishes.
+
+    Parameters
+    ----------
+    path : str
+        A directory of images or a video file.
+    output : file
+        The text file the JSON Lines records are written to.
+    workers : int, optional
+        The number of worker processes. Default is the number of CPUs.
+    chunk_size : int, optional
+        The number of inputs decoded and dispatched at a time. Default is 64.
+    connect4_args : dict, optional
+        Keyword arguments for the Connect4 object of each worker.
+
+    Returns
+    -------
+    int
+        The number of records written.
+    """
+    items = image_items(path) if os.path.isdir(path) else video_items(path)
+    count = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(connect4_args or {},)) as executor:
+        for chunk in chunked(items, chunk_size):
+            for record in executor.map(detect_item, chunk):
+                output.write(json.dumps(record) + '\n')
+                count += 1
+            output.flush()
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Detect Connect 4 boards in a directory of images or a video file.')
+    parser.add_argument('path', help='a directory of images or a video file')
+    parser.add_argument('-o', '--output', help='the JSON Lines file to write, stdout by default')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='the number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=64, help='the number of frames decoded at a time')
+    parser.add_argument('--piece-radius', type=int, default=33, help='the radius of a hole in pixels')
+    parser.add_argument('--radius-delta', type=int, default=3, help='the allowed radius error in pixels')
+    parser.add_argument('--coarse-limit', type=int, metavar='PIXELS', help='search frames larger than this many pixels downscaled first, then refine each hole')
+    args = parser.parse_args(argv)
+
+    connect4_args = {'piece_radius': args.piece_radius, 'radius_delta': args.radius_delta,
+                     'coarse_limit': args.coarse_limit}
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        run_batch(args.path, output, args.workers, args.chunk_size, connect4_args)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
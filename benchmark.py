@@ -0,0 +1,206 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from bitboard import Bitboard
+from connect4 import Connect4
+from grid import fit_grid
+from synthetic import BoardRenderer, random_board
+
+# The hole radius that detects all 42 holes in each sample photo. The other photos are taken at
+# too steep an angle, or the board is too small and partly covered, for holes of one radius to be
+# found, so they would only time the failure path.
+SAMPLE_RADII = {
+    'connect4_1.jpg': 24,
+    'connect4_3.jpg': 58,
+    'connect4_5.jpg': 38,
+}
+
+PERCENTILES = (50, 90, 99)
+
+
+def load_cases(image_dir: str, generated: int) -> List[dict]:
+    """
+    Returns the benchmark inputs, the sample photos followed by generated boards.
+    """
+    cases = []
+    for name in sorted(SAMPLE_RADII):
+        img = cv2.imread(os.path.join(image_dir, name))
+        if img is not None:
+            cases.append({'name': name, 'img': img, 'radius': SAMPLE_RADII[name]})
+    renderer = BoardRenderer(seed=0)
+    for idx in range(generated):
+        frame = renderer.render(random_board(renderer.rng), blur=3)
+        cases.append({'name': 'generated_%d' % idx, 'img': frame.image, 'radius': renderer.radius})
+    return cases
+
+
+def measure(func: Callable, repeat: int, warmup: int = 1) -> Tuple[List[float], int]:
+    """
+    Calls func repeatedly and returns the time of each successful call in seconds and the number
+    of calls that failed with a ValueError. Failed detections take a different path, so they are
+    counted rather than timed.
+    """
+    for _ in range(warmup):
+        try:
+            func()
+        except ValueError:
+            pass
+    times, failures = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            func()
+        except ValueError:
+            failures += 1
+            continue
+        times.append(time.perf_counter() - start)
+    return times, failures
+
+
+def summarize(times: List[float], failures: int = 0) -> Dict[str, Optional[float]]:
+    """
+    Returns the count, failure count, mean, min and percentiles of a list of times. The
+    statistics are None if there are no times.
+    """
+    times = np.asarray(times)
+    summary = {'n': int(len(times)), 'failures': failures}
+    for key, func in [('mean', np.mean), ('min', np.min)]:
+        summary[key] = float(func(times)) if len(times) else None
+    for percentile in PERCENTILES:
+        summary['p%d' % percentile] = float(np.percentile(times, percentile)) if len(times) else None
+    return summary
+
+
+def run_benchmarks(cases: List[dict], repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    Times each stage of detection and rendering over the cases.
+
+    Parameters
+    ----------
+    cases : list of dict
+        The inputs from load_cases().
+    repeat : int
+        The number of timed calls per stage and case.
+
+    Returns
+    -------
+    dict
+        The timing summary of each stage, keyed by stage name.
+    """
+    timings = {}
+    failures = {}
+
+    def add(stage, measured):
+        times, failed = measured
+        timings.setdefault(stage, []).extend(times)
+        failures[stage] = failures.get(stage, 0) + failed
+
+    for case in cases:
+        img = case['img']
+        connect4 = Connect4(piece_radius=case['radius'])
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        radius = connect4.piece_radius
+        delta = connect4.radius_delta
+        candidates = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, dp=1, minDist=radius, param1=200,
+                                      param2=connect4.hough_param2, minRadius=radius - delta,
+                                      maxRadius=radius + delta)
+
+        add('detect_circles', measure(lambda: connect4.detect_circles(img), repeat))
+        if candidates is not None:
+            add('remove_overlapping_circles',
+                measure(lambda: connect4.remove_overlapping_circles(candidates[0]), repeat))
+            circles = connect4.remove_overlapping_circles(candidates[0])
+            if len(circles) >= 7:
+                add('fit_grid', measure(lambda: fit_grid(circles), repeat))
+        add('from_image', measure(lambda: connect4.from_image(img), repeat))
+
+        try:
+            connect4.from_image(img)
+        except ValueError:
+            continue
+        add('draw_circles', measure(connect4.draw_circles, repeat))
+        add('draw_circle_colors', measure(connect4.draw_circle_colors, repeat))
+        add('draw_board_state', measure(connect4.draw_board_state, repeat))
+        add('check_winner', measure(connect4.check_winner, repeat))
+
+    # Win checks on random positions, converted once and checked many times.
+    rng = np.random.default_rng(0)
+    bitboards = []
+    for _ in range(100):
+        bitboard = Bitboard()
+        for _ in range(rng.integers(0, 42)):
+            bitboard.play(int(rng.choice(bitboard.legal_moves())))
+        bitboards.append(bitboard)
+    add('bitboard_winner', measure(lambda: [bitboard.winner() for bitboard in bitboards], repeat))
+    timings['bitboard_winner'] = [t / len(bitboards) for t in timings['bitboard_winner']]
+
+    return {stage: summarize(times, failures[stage]) for stage, times in timings.items()}
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float, metric: str = 'p50') -> List[str]:
+    """
+    Returns a message for every stage whose metric is more than threshold slower than the baseline.
+    """
+    regressions = []
+    for stage, summary in results.items():
+        if stage not in baseline:
+            continue
+        before = baseline[stage].get(metric)
+        after = summary[metric]
+        if before is None or after is None:
+            continue
+        if before > 0 and after > before * (1 + threshold):
+            regressions.append('%s %s regressed from %.3f ms to %.3f ms (%+.0f%%)'
+                               % (stage, metric, before * 1e3, after * 1e3, (after / before - 1) * 100))
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark Connect 4 detection, rendering and win checking.')
+    parser.add_argument('--images', default='images', help='the directory of sample photos')
+    parser.add_argument('--generated', type=int, default=4, help='the number of generated boards')
+    parser.add_argument('--repeat', type=int, default=20, help='the number of timed calls per stage and input')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='the allowed slowdown against the baseline, 0.1 is 10%%')
+    parser.add_argument('--metric', default='p50', help='the statistic to compare, such as p50 or p90')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(load_cases(args.images, args.generated), args.repeat)
+    for stage, summary in results.items():
+        if summary['n'] == 0:
+            print('%-28s n=0    failed=%d' % (stage, summary['failures']))
+            continue
+        print('%-28s n=%-4d p50=%9.3f ms  p90=%9.3f ms  p99=%9.3f ms  failed=%d'
+              % (stage, summary['n'], summary['p50'] * 1e3, summary['p90'] * 1e3, summary['p99'] * 1e3,
+                 summary['failures']))
+
+    if args.output:
+        report = {'python': sys.version.split()[0], 'platform': platform.platform(),
+                  'opencv': cv2.__version__, 'numpy': np.__version__, 'results': results}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold, args.metric)
+        for regression in regressions:
+            print(regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import numpy as np
+from typing import List, Optional
+
+ROWS = 6
+COLS = 7
+# Each column uses one extra sentinel bit so shifts never wrap into the next column.
+COL_BITS = ROWS + 1
+
+BOTTOM_MASK = sum(1 << (col * COL_BITS) for col in range(COLS))
+BOARD_MASK = BOTTOM_MASK * ((1 << ROWS) - 1)
+TOP_MASK = sum(1 << (col * COL_BITS + ROWS - 1) for col in range(COLS))
+COLUMN_MASKS = [((1 << ROWS) - 1) << (col * COL_BITS) for col in range(COLS)]
+
+# Bit weight of every cell of a Connect4.board array (row 0 is the top row).
+CELL_WEIGHTS = np.array([[1 << (col * COL_BITS + (ROWS - 1 - row)) for col in range(COLS)]
+                         for row in range(ROWS)], dtype=np.int64)
+
+PIECES = ('R', 'Y')
+EMPTY = 'O'
+
+
+class Bitboard:
+    """
+    A compact bitboard representation of a 6x7 Connect 4 board.
+
+    The board is stored as one bit mask per player plus the height of each column. Bits are
+    laid out column by column from the bottom up, with one unused sentinel bit on top of each
+    column, so a four in a row in any direction can be found with a few shifts and ands.
+
+    Attributes
+    ----------
+    masks : list of int
+        The bit masks of the red and yellow pieces, in that order.
+    height : list of int
+        The number of pieces in each column.
+    first : int
+        The index of the player that moved first, 0 for red and 1 for yellow.
+    count : int
+        The number of pieces on the board.
+    history : list of int
+        The columns played through play(), used by undo().
+
+    Methods
+    -------
+    from_board(board, first='R')
+        Creates a Bitboard from a Connect4.board array.
+    to_board()
+        Returns the board as a Connect4.board array.
+    is_win(mask)
+        Returns True if the mask contains four in a row.
+    winner()
+        Returns 'R' or 'Y' if that player has four in a row, None otherwise.
+    key()
+        Returns a key that uniquely identifies the position and the player to move.
+    legal_moves()
+        Returns the columns that are not full.
+    play(col)
+        Drops a piece for the player to move into a column.
+    undo()
+        Takes back the last move made with play().
+    """
+
+    def __init__(self, first: str = 'R') -> None:
+        """
+        Initializes an empty board.
+
+        Parameters
+        ----------
+        first : str, optional
+            The player that moves first, 'R' or 'Y'. Default is 'R'.
+        """
+        self.masks = [0, 0]
+        self.height = [0] * COLS
+        self.first = PIECES.index(first)
+        self.count = 0
+        self.history = []
+
+    @classmethod
+    def from_board(cls, board: np.ndarray, first: str = 'R') -> 'Bitboard':
+        """
+        Creates a Bitboard from a Connect4.board array.
+
+        Parameters
+        ----------
+        board : numpy.ndarray
+            A 6x7 array of 'R', 'Y' and 'O' with row 0 at the top of the board. Any value other
+            than 'R' or 'Y' is treated as an empty cell.
+        first : str, optional
+            The player that moved first, 'R' or 'Y'. Default is 'R'.
+
+        Returns
+        -------
+        Bitboard
+            The board as a bitboard.
+        """
+        board = np.asarray(board)
+        if board.shape != (ROWS, COLS):
+            raise ValueError('Board must be 6x7!')
+        red = board == 'R'
+        yellow = board == 'Y'
+        occupied = red | yellow
+
+        bitboard = cls(first)
+        bitboard.masks = [int(CELL_WEIGHTS[red].sum()), int(CELL_WEIGHTS[yellow].sum())]
+        # The highest piece in a column sets its height, even if there are gaps below it.
+        bitboard.height = np.where(occupied.any(axis=0), ROWS - occupied.argmax(axis=0), 0).tolist()
+        bitboard.count = int(occupied.sum())
+        return bitboard
+
+    def to_board(self) -> np.ndarray:
+        """
+        Returns the board as a Connect4.board array.
+
+        Returns
+        -------
+        numpy.ndarray
+            A 6x7 array of 'R', 'Y' and 'O' with row 0 at the top of the board.
+        """
+        board = np.full((ROWS, COLS), EMPTY)
+        for piece, mask in zip(PIECES, self.masks):
+            board[(CELL_WEIGHTS & mask) != 0] = piece
+        return board
+
+    @staticmethod
+    def is_win(mask: int) -> bool:
+        """
+        Returns True if the mask contains four in a row.
+
+        Parameters
+        ----------
+        mask : int
+            The bit mask of one player's pieces.
+
+        Returns
+        -------
+        bool
+            True if the mask has four in a row horizontally, vertically or diagonally.
+        """
+        # Vertical, horizontal and the two diagonals, unrolled to keep the check branch-light.
+        pairs = mask & (mask >> 1)
+        if pairs & (pairs >> 2):
+            return True
+        pairs = mask & (mask >> 7)
+        if pairs & (pairs >> 14):
+            return True
+        pairs = mask & (mask >> 6)
+        if pairs & (pairs >> 12):
+            return True
+        pairs = mask & (mask >> 8)
+        return bool(pairs & (pairs >> 16))
+
+    def winner(self) -> Optional[str]:
+        """
+        Returns 'R' or 'Y' if that player has four in a row, None otherwise.
+        """
+        for piece, mask in zip(PIECES, self.masks):
+            if self.is_win(mask):
+                return piece
+        return None
+
+    def key(self) -> int:
+        """
+        Returns a key that uniquely identifies the position and the player to move.
+        """
+        return self.masks[self.current_player()] + self.masks[0] + self.masks[1] + BOTTOM_MASK
+
+    def current_player(self) -> int:
+        """
+        Returns the index of the player to move, 0 for red and 1 for yellow.
+        """
+        return (self.first + self.count) & 1
+
+    def can_play(self, col: int) -> bool:
+        """
+        Returns True if the column is not full.
+        """
+        return self.height[col] < ROWS
+
+    def legal_moves(self) -> List[int]:
+        """
+        Returns the columns that are not full.
+
+        Returns
+        -------
+        list of int
+            The playable columns, from left to right.
+        """
+        return [col for col in range(COLS) if self.height[col] < ROWS]
+
+    def play(self, col: int) -> None:
+        """
+        Drops a piece for the player to move into a column.
+
+        Parameters
+        ----------
+        col : int
+            The column to play, from 0 to 6.
+        """
+        if not self.can_play(col):
+            raise ValueError('Column is full!')
+        self.masks[self.current_player()] |= 1 << (col * COL_BITS + self.height[col])
+        self.height[col] += 1
+        self.count += 1
+        self.history.append(col)
+
+    def undo(self) -> int:
+        """
+        Takes back the last move made with play().
+
+        Returns
+        -------
+        int
+            The column of the move that was taken back.
+        """
+        col = self.history.pop()
+        self.count -= 1
+        self.height[col] -= 1
+        self.masks[self.current_player()] &= ~(1 << (col * COL_BITS + self.height[col]))
+        return col
@@ -0,0 +1,256 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bitboard import Bitboard, COL_BITS, COLS
+from solver import SolveResult, Solver
+
+MAGIC = b'C4BK'
+VERSION = 1
+
+# The header holds the magic, version, number of plies and number of records. Each record holds
+# the canonical key, the score, the best column, the search depth and whether the score is exact.
+HEADER = struct.Struct('<4sHHI')
+RECORD = struct.Struct('<QhbBB')
+
+COLUMN_BITS = (1 << COL_BITS) - 1
+
+
+def mirror_key(key: int) -> int:
+    """
+    Returns the key of the position mirrored left to right.
+    """
+    mirrored = 0
+    for col in range(COLS):
+        mirrored |= ((key >> (col * COL_BITS)) & COLUMN_BITS) << ((COLS - 1 - col) * COL_BITS)
+    return mirrored
+
+
+def canonical_key(bitboard: Bitboard) -> Tuple[int, bool]:
+    """
+    Returns the smaller of the keys of a position and of its mirror image, and True if it is the
+    key of the mirror image. A position and its mirror image share one record in the book.
+    """
+    key = bitboard.key()
+    mirrored = mirror_key(key)
+    if mirrored < key:
+        return mirrored, True
+    return key, False
+
+
+class OpeningBook:
+    """
+    A database of solved early game positions, read through a memory map.
+
+    The book file is a short header followed by fixed width records sorted by the canonical key
+    of their position. Opening a book maps the file without reading it, and a lookup is a binary
+    search over the records, so only the pages touched by the search are ever loaded. Positions
+    are stored once for a position and its mirror image, with the best column given for the
+    orientation with the smaller key.
+
+    Attributes
+    ----------
+    path : str
+        The book file.
+    plies : int
+        The number of moves the book covers.
+    size : int
+        The number of positions in the book.
+
+    Methods
+    -------
+    lookup(board, first='R')
+        Returns the stored result for a Connect4.board array.
+    lookup_bitboard(bitboard)
+        Returns the stored result for a Bitboard.
+    close()
+        Unmaps the book file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens a book file.
+
+        Parameters
+        ----------
+        path : str
+            The book file written by write_book().
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.plies, self.size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError('Not an opening book: %s' % path)
+        if len(self.map) != HEADER.size + self.size * RECORD.size:
+            self.map.close()
+            raise ValueError('Opening book is truncated: %s' % path)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __enter__(self) -> 'OpeningBook':
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.close()
+        return False
+
+    def close(self) -> None:
+        self.map.close()
+
+    def find(self, key: int) -> Optional[tuple]:
+        """
+        Returns the record with a canonical key, or None if it is not in the book.
+        """
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            record = RECORD.unpack_from(self.map, HEADER.size + middle * RECORD.size)
+            if record[0] < key:
+                low = middle + 1
+            elif record[0] > key:
+                high = middle
+            else:
+                return record
+        return None
+
+    def lookup_bitboard(self, bitboard: Bitboard) -> Optional[SolveResult]:
+        """
+        Returns the stored result for a Bitboard, or None if the position is not in the book.
+        """
+        key, mirrored = canonical_key(bitboard)
+        record = self.find(key)
+        if record is None:
+            return None
+        _, score, column, depth, exact = record
+        if column < 0:
+            column = None
+        elif mirrored:
+            column = COLS - 1 - column
+        return SolveResult(column, score, depth, bool(exact))
+
+    def lookup(self, board: np.ndarray, first: str = 'R') -> Optional[SolveResult]:
+        """
+        Returns the stored result for a Connect4.board array, or None if it is not in the book.
+
+        Parameters
+        ----------
+        board : numpy.ndarray
+            A 6x7 array of 'R', 'Y' and 'O' with row 0 at the top of the board.
+        first : str, optional
+            The player that moved first, 'R' or 'Y'. Default is 'R'.
+        """
+        return self.lookup_bitboard(Bitboard.from_board(board, first))
+
+
+def book_positions(plies: int) -> Dict[int, List[int]]:
+    """
+    Returns the moves leading to every position of up to plies moves that is not already won,
+    keyed by canonical key. Only one of a position and its mirror image is included.
+    """
+    positions = {}
+    bitboard = Bitboard()
+
+    def visit():
+        key, _ = canonical_key(bitboard)
+        if key in positions or bitboard.winner() is not None:
+            return
+        positions[key] = list(bitboard.history)
+        if bitboard.count == plies:
+            return
+        for col in bitboard.legal_moves():
+            bitboard.play(col)
+            visit()
+            bitboard.undo()
+
+    visit()
+    return positions
+
+
+# Each worker process keeps its own solver, and its transposition table, between positions.
+_solver = None
+
+
+def init_worker(time_budget: float) -> None:
+    global _solver
+    _solver = Solver(time_budget=time_budget, cache_size=0)
+
+
+def solve_position(moves: List[int]) -> tuple:
+    """
+    Solves the position reached by a list of moves and returns its book record.
+    """
+    bitboard = Bitboard()
+    for col in moves:
+        bitboard.play(col)
+    key, mirrored = canonical_key(bitboard)
+    result = _solver.solve_bitboard(bitboard)
+    column = -1 if result.column is None else result.column
+    if mirrored and column >= 0:
+        column = COLS - 1 - column
+    return key, result.score, column, result.depth, int(result.exact)
+
+
+def write_book(path: str, records: List[tuple], plies: int) -> None:
+    """
+    Writes book records, sorted by key, to a book file.
+    """
+    records = sorted(records)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, plies, len(records)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+
+
+def build_book(path: str, plies: int = 6, time_budget: float = 1.0, workers: Optional[int] = None) -> int:
+    """
+    Solves every position of up to plies moves and writes them to a book file.
+
+    Parameters
+    ----------
+    path : str
+        The book file to write.
+    plies : int, optional
+        The number of moves the book covers. Default is 6.
+    time_budget : float, optional
+        The time to search each position for in seconds. Default is 1.0.
+    workers : int, optional
+        The number of worker processes. Default is the number of CPUs.
+
+    Returns
+    -------
+    int
+        The number of positions written.
+    """
+    positions = list(book_positions(plies).values())
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(time_budget,)) as executor:
+        records = list(executor.map(solve_position, positions, chunksize=16))
+    write_book(path, records, plies)
+    return len(records)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Build an opening book of solved early game positions.')
+    parser.add_argument('-o', '--output', default='book.bin', help='the book file to write')
+    parser.add_argument('--plies', type=int, default=6, help='the number of moves the book covers')
+    parser.add_argument('--time-budget', type=float, default=1.0, help='the time to search each position for in seconds')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='the number of worker processes')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    count = build_book(args.output, args.plies, args.time_budget, args.workers)
+    elapsed = time.perf_counter() - start
+    print('%d positions in %.1f s, %d bytes' % (count, elapsed, os.path.getsize(args.output)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
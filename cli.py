@@ -0,0 +1,156 @@
+# The command line entry point, with live, headless, batch, book, supervise, pipeline, replay,
+# calibrate and import-time subcommands.
+#
+# Only the standard library is imported here. OpenCV, numpy and the detector are imported by each
+# subcommand when it runs, so the process starts and parses its arguments without paying for them,
+# and import-time checks that this stays true.
+import argparse
+import subprocess
+import sys
+from typing import List, Optional
+
+# The longest import of each module in a fresh interpreter, in seconds, before it is a regression.
+IMPORT_BUDGETS = {
+    'cli': 0.05,
+    'connect4': 0.5,
+    'main': 0.6,
+    'batch': 0.6,
+}
+
+# Modules that importing cli must not pull in, and modules nothing should import at all.
+LAZY_MODULES = ('cv2', 'numpy')
+UNUSED_MODULES = ('PyQt5', 'sklearn')
+
+IMPORT_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - start
+print(elapsed, ' '.join(name for name in %r if name in sys.modules))
+'''
+
+
+def measure_import(module: str, repeat: int = 3):
+    """
+    Imports a module in repeat fresh interpreters and returns the fastest import time in seconds
+    and which of the checked heavy modules it loaded.
+    """
+    best, loaded = None, []
+    for _ in range(repeat):
+        script = IMPORT_SCRIPT % (module, LAZY_MODULES + UNUSED_MODULES)
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+        elapsed, *loaded = result.stdout.split()
+        best = float(elapsed) if best is None else min(best, float(elapsed))
+    return best, loaded
+
+
+def import_time(repeat: int = 3, scale: float = 1.0) -> int:
+    failures = 0
+    for module, budget in IMPORT_BUDGETS.items():
+        elapsed, loaded = measure_import(module, repeat)
+        problems = []
+        if elapsed > budget * scale:
+            problems.append('over budget of %.0f ms' % (budget * scale * 1000))
+        if module == 'cli':
+            problems += ['imports %s' % name for name in loaded if name in LAZY_MODULES]
+        problems += ['imports %s' % name for name in loaded if name in UNUSED_MODULES]
+        failures += bool(problems)
+        print('%-10s %7.1f ms  %s' % (module, elapsed * 1000, ', '.join(problems) or 'ok'))
+    return 1 if failures else 0
+
+
+def address(value: str):
+    """
+    Parses a [HOST:]PORT address, listening on localhost only if no host is given.
+    """
+    host, _, port = value.rpartition(':')
+    try:
+        return host or '127.0.0.1', int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid address: %s' % value)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Detect Connect 4 boards from a webcam, images or video.')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    live = commands.add_parser('live', help='show the detection from the webcam in a window')
+    live.add_argument('--profile', action='store_true', help='time each stage and show the timings on screen')
+    live.add_argument('--profile-dump', help='write the stage timings to this JSON file every 10 seconds')
+    live.add_argument('--roi', default='roi.json', help='the file the board region is saved in')
+    live.add_argument('--select-roi', action='store_true', help='select the board region and save it before starting')
+    live.add_argument('--announce', choices=('speech', 'stdout'), help='announce moves and the winner')
+    live.add_argument('--locate', action='store_true', help='find the board and correct its perspective automatically')
+    live.add_argument('--serve', metavar='[HOST:]PORT', type=address, help='publish the board to clients over HTTP')
+    live.add_argument('--record', metavar='PATH', help='record every frame and its detection to this file')
+    live.add_argument('--coarse-limit', type=int, metavar='PIXELS', help='search frames larger than this many pixels downscaled first, then refine each hole')
+    live.add_argument('--colors', metavar='PATH', help='the color table to classify discs with, the camera\'s own by default')
+
+    headless = commands.add_parser('headless', help='write each new board from the webcam as a JSON line')
+    headless.add_argument('-o', '--output', help='the JSON Lines file to write, stdout by default')
+    headless.add_argument('--roi', default='roi.json', help='the file the board region is saved in')
+    headless.add_argument('--profile-dump', help='write the stage timings to this JSON file every 10 seconds')
+    headless.add_argument('--announce', choices=('speech', 'stdout'), help='announce moves and the winner')
+    headless.add_argument('--locate', action='store_true', help='find the board and correct its perspective automatically')
+    headless.add_argument('--serve', metavar='[HOST:]PORT', type=address, help='publish the board to clients over HTTP')
+    headless.add_argument('--record', metavar='PATH', help='record every frame and its detection to this file')
+    headless.add_argument('--coarse-limit', type=int, metavar='PIXELS', help='search frames larger than this many pixels downscaled first, then refine each hole')
+    headless.add_argument('--colors', metavar='PATH', help='the color table to classify discs with, the camera\'s own by default')
+
+    # The batch, book, supervise, pipeline, replay and calibrate arguments are parsed by their own main functions, imported only
+    # when they run
+    commands.add_parser('batch', add_help=False, help='detect boards in a directory of images or a video file')
+    commands.add_parser('book', add_help=False, help='build an opening book of solved early game positions')
+    commands.add_parser('supervise', add_help=False, help='detect several boards from cameras or video files')
+    commands.add_parser('pipeline', add_help=False, help='detect from a camera or video with each stage in its own process')
+    commands.add_parser('replay', add_help=False, help='replay a recording through the detector and compare the boards')
+    commands.add_parser('calibrate', add_help=False, help='learn the disc colors of a camera from frames of a known board')
+
+    check = commands.add_parser('import-time', help='check the import time of each entry point against its budget')
+    check.add_argument('--repeat', type=int, default=3, help='the number of fresh interpreters to time each import in')
+    check.add_argument('--scale', type=float, default=1.0, help='multiply every budget by this, for slow machines')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == 'batch':
+        import batch
+        batch.main(argv[1:])
+        return 0
+    if argv and argv[0] == 'book':
+        import book
+        book.main(argv[1:])
+        return 0
+    if argv and argv[0] == 'supervise':
+        import supervisor
+        supervisor.main(argv[1:])
+        return 0
+    if argv and argv[0] == 'pipeline':
+        import pipeline
+        return pipeline.main(argv[1:])
+    if argv and argv[0] == 'replay':
+        import recording
+        return recording.main(argv[1:])
+    if argv and argv[0] == 'calibrate':
+        import colortable
+        return colortable.main(argv[1:])
+
+    args = build_parser().parse_args(argv)
+    if args.command == 'live':
+        import main as live
+        return live.main(args.profile or args.profile_dump is not None, args.profile_dump, args.roi,
+                         args.select_roi, args.announce, args.locate, args.serve, args.record, args.colors,
+                         args.coarse_limit) or 0
+    if args.command == 'headless':
+        import main as live
+        return live.headless(args.roi, args.output, args.profile_dump is not None, args.profile_dump,
+                             args.announce, args.locate, args.serve, args.record, args.colors,
+                             args.coarse_limit)
+    return import_time(args.repeat, args.scale)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
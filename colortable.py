@@ -0,0 +1,256 @@
+import argparse
+import os
+import re
+import sys
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# The class codes of the table, in the order of the cells of Connect4.board
+CLASSES = ('O', 'R', 'Y')
+
+
+def camera_path(source=0, directory: str = '.') -> str:
+    """
+    Returns the file the color table of a camera index, video file or stream URL is saved in.
+    """
+    name = re.sub(r'[^A-Za-z0-9]+', '_', str(source)).strip('_')
+    return os.path.join(directory, 'colors_%s.npz' % name)
+
+
+def parse_board(value: str) -> np.ndarray:
+    """
+    Parses a board of six rows of 'R', 'Y' and 'O' separated by '/', top row first.
+    """
+    rows = value.upper().split('/')
+    if len(rows) != 6 or any(len(row) != 7 or set(row) - set(CLASSES) for row in rows):
+        raise ValueError('A board is six rows of seven R, Y or O separated by /: %s' % value)
+    return np.array([list(row) for row in rows])
+
+
+class ColorTable:
+    """
+    A quantized lookup table from a BGR color to the empty, red or yellow class of a disc.
+
+    Each class is learnt as a cluster, the mean and covariance of the colors sampled from the cells
+    of a known board, so the classes follow the lighting and camera they were calibrated under.
+    The clusters are then compiled into a table holding the most likely class of every quantized
+    color, so classifying a sample is one array index rather than a comparison with every bound.
+
+    Attributes
+    ----------
+    bits : int
+        The number of bits kept of each color channel, giving a table of 2 ** (3 * bits) entries.
+    table : numpy.ndarray
+        The class code of every quantized (b, g, r) color, an index into CLASSES.
+    means : numpy.ndarray
+        The mean BGR color of each class.
+    covariances : numpy.ndarray
+        The 3x3 BGR covariance of each class.
+
+    Methods
+    -------
+    fit(samples, bits=5)
+        Learns the class clusters from labelled samples and compiles them into a table.
+    calibrate(connect4, frames, board, bits=5)
+        Learns a table from frames of a known board.
+    classify(samples)
+        Returns the class code of each BGR sample.
+    save(path)
+        Saves the table.
+    load(path)
+        Loads a saved table.
+    """
+
+    # Added to the diagonal of every covariance, so a class sampled under very even light does not
+    # claim only the handful of colors it was seen in
+    min_variance = 16.0
+
+    def __init__(self, table: np.ndarray, means: np.ndarray, covariances: np.ndarray) -> None:
+        """
+        Initializes the table.
+
+        Parameters
+        ----------
+        table : numpy.ndarray
+            A cube of class codes indexed by the quantized b, g and r of a color.
+        means : numpy.ndarray
+            The mean BGR color of each class.
+        covariances : numpy.ndarray
+            The 3x3 BGR covariance of each class.
+        """
+        self.table = np.ascontiguousarray(table, dtype=np.uint8)
+        self.bits = int(np.log2(self.table.shape[0]))
+        self.shift = 8 - self.bits
+        self.means = np.asarray(means, dtype=np.float64)
+        self.covariances = np.asarray(covariances, dtype=np.float64)
+
+    @classmethod
+    def fit(cls, samples: Dict[str, np.ndarray], bits: int = 5) -> 'ColorTable':
+        """
+        Learns the class clusters from labelled samples and compiles them into a table.
+
+        Parameters
+        ----------
+        samples : dict
+            The BGR samples of each of 'O', 'R' and 'Y', as arrays of shape (n, 3).
+        bits : int, optional
+            The number of bits kept of each color channel. Default is 5, a 32 KB table.
+
+        Returns
+        -------
+        ColorTable
+            The compiled table.
+        """
+        means, covariances = [], []
+        for name in CLASSES:
+            values = np.asarray(samples.get(name, []), dtype=np.float64).reshape(-1, 3)
+            if len(values) < 2:
+                raise ValueError('No samples of class %s to calibrate with!' % name)
+            means.append(values.mean(axis=0))
+            covariances.append(np.cov(values, rowvar=False) + np.eye(3) * cls.min_variance)
+        means, covariances = np.array(means), np.array(covariances)
+
+        # The class of each quantized color is the cluster most likely to have produced the center
+        # of its bin, by the Gaussian log likelihood of every cluster
+        levels = (np.arange(2 ** bits) << (8 - bits)) + (1 << (8 - bits)) / 2
+        b, g, r = np.meshgrid(levels, levels, levels, indexing='ij')
+        colors = np.stack([b.ravel(), g.ravel(), r.ravel()], axis=1)
+        scores = []
+        for mean, covariance in zip(means, covariances):
+            difference = colors - mean
+            distance = np.einsum('ij,jk,ik->i', difference, np.linalg.inv(covariance), difference)
+            scores.append(-0.5 * (distance + np.linalg.slogdet(covariance)[1]))
+        table = np.argmax(scores, axis=0).reshape(b.shape)
+        return cls(table, means, covariances)
+
+    @classmethod
+    def calibrate(cls, connect4, frames: Iterable[np.ndarray], board, bits: int = 5) -> 'ColorTable':
+        """
+        Learns a table from frames of a known board.
+
+        Parameters
+        ----------
+        connect4 : Connect4
+            The detector used to find the holes of each frame.
+        frames : iterable of numpy.ndarray
+            BGR frames of the board, ideally a few under the light it will be played in.
+        board : array_like
+            The 6x7 board of 'R', 'Y' and 'O' shown in every frame, holding at least one disc of
+            each color.
+
+        Returns
+        -------
+        ColorTable
+            The compiled table.
+        """
+        labels = np.asarray(board).ravel()
+        samples = {name: [] for name in CLASSES}
+        for frame in frames:
+            try:
+                connect4.from_image(frame)
+            except ValueError:
+                continue
+            cells = connect4.img[connect4.sample_index(connect4.img, connect4.circles)]
+            for name in CLASSES:
+                samples[name].append(cells[labels == name].reshape(-1, 3))
+        if not samples['O']:
+            raise ValueError('Board not found in any frame!')
+        samples = {name: np.concatenate(values) if values else np.zeros((0, 3))
+                   for name, values in samples.items()}
+        return cls.fit(samples, bits)
+
+    def classify(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Returns the class code of each BGR sample, an array of the samples' shape without the
+        last axis.
+        """
+        quantized = samples >> self.shift
+        return self.table[quantized[..., 0], quantized[..., 1], quantized[..., 2]]
+
+    def save(self, path) -> None:
+        """
+        Saves the table to a file path or a binary file object.
+        """
+        if not isinstance(path, str):
+            np.savez_compressed(path, table=self.table, means=self.means, covariances=self.covariances)
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Written through a file object so numpy does not append a second extension
+        with open(path, 'wb') as f:
+            self.save(f)
+
+    @classmethod
+    def load(cls, path) -> 'ColorTable':
+        """
+        Loads a table from a file path or a binary file object.
+        """
+        with np.load(path) as data:
+            return cls(data['table'], data['means'], data['covariances'])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Learn the disc colors of a camera from frames of a known board.')
+    parser.add_argument('board', help='the board shown, six rows of R, Y or O separated by /, top row first')
+    parser.add_argument('images', nargs='*', help='images of the board, frames from the camera by default')
+    parser.add_argument('--camera', type=int, default=0, help='the camera index to capture from')
+    parser.add_argument('--frames', type=int, default=10, help='the number of camera frames to learn from')
+    parser.add_argument('-o', '--output', help='the table file to write, the camera\'s file by default')
+    parser.add_argument('--roi', default='roi.json', help='the file the board region is saved in')
+    parser.add_argument('--locate', action='store_true', help='find the board and correct its perspective automatically')
+    parser.add_argument('--piece-radius', type=int, default=33, help='the radius of a hole in pixels')
+    parser.add_argument('--radius-delta', type=int, default=3, help='the allowed radius error in pixels')
+    parser.add_argument('--coarse-limit', type=int, metavar='PIXELS',
+                        help='search frames larger than this many pixels downscaled first, then refine each hole')
+    parser.add_argument('--bits', type=int, default=5, help='the number of bits kept of each color channel')
+    args = parser.parse_args(argv)
+
+    try:
+        board = parse_board(args.board)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Imported here so loading a table does not need the detector or OpenCV
+    import cv2
+    from connect4 import Connect4
+    from cropper import crop_image_from_roi, load_roi
+    from locator import BoardLocator
+
+    if args.images:
+        frames = [cv2.imread(path) for path in args.images]
+        if any(frame is None for frame in frames):
+            print('Error reading images', file=sys.stderr)
+            return 1
+    else:
+        from webcam import Webcam
+        webcam = Webcam(source=args.camera)
+        if not webcam.open():
+            print('Error opening webcam', file=sys.stderr)
+            return 1
+        frames = [webcam.get_frame() for _ in range(args.frames)]
+        webcam.close()
+        frames = [frame for frame in frames if frame is not None]
+        if frames and os.path.exists(args.roi):
+            # Scaled to the frames, in case the camera resolution changed since it was selected
+            roi = load_roi(args.roi, frames[0].shape)
+            frames = [crop_image_from_roi(frame, roi) for frame in frames]
+
+    connect4 = Connect4(piece_radius=args.piece_radius, radius_delta=args.radius_delta,
+                        coarse_limit=args.coarse_limit, locator=BoardLocator() if args.locate else None)
+    try:
+        table = ColorTable.calibrate(connect4, frames, board, args.bits)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    output = args.output or camera_path(args.camera)
+    table.save(output)
+    for name, mean in zip(CLASSES, table.means):
+        print('%s  BGR %5.1f %5.1f %5.1f' % (name, *mean))
+    print('Saved to %s' % output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
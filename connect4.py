@@ -1,55 +1,285 @@
 import cv2
 import numpy as np
-from sklearn.cluster import KMeans
+from bitboard import Bitboard
+from grid import fit_grid
+from moves import MoveTracker
+from instrumentation import StageTimer
+from scaler import Scaler
 
 class Connect4:
-    board = np.zeros((6, 7), dtype=int)
+    # Everything that changes from frame to frame is set per instance by reset(), so that several
+    # detectors never share a board
+    board = None
 
     piece_radius = 35
     radius_delta = 2
+    hough_param2 = 20
+
+    # Coarse to fine mode: frames larger than coarse_limit are searched at that size first, and
+    # each hole is then refined in a full resolution window
+    coarse_limit = None
+    refine_margin = 4
+
+    # Circles further from the fitted lattice than this share of the hole radius, on average, are
+    # not the board
+    max_grid_residual = 0.25
 
     img = None
     circles = None
     piece_colors = None
+    grid_residual = None
+    piece_confidence = None
 
     red_low = np.array([50, 0, 0])
     red_high = np.array([255, 100, 100])
     yellow_low = np.array([50, 50, 0])
     yellow_high = np.array([255, 255, 100])
 
-    def __init__(self, piece_radius=33, radius_delta=3) -> None:
+    # A ColorTable calibrated for the camera replaces the bounds above when one is given
+    color_table = None
+
+    # Disc colours are sampled from a disc of this share of the hole radius, about sample_steps
+    # samples across its radius
+    sample_ratio = 0.5
+    sample_steps = 5
+    sample_circles = None
+    sample_shape = None
+    sample_points = None
+
+    # Tracking mode: the grid found by detect_circles is reused until the board moves
+    tracking = False
+    drift_threshold = 25
+    tracked_circles = None
+    anchor_points = None
+    anchor_reference = None
+
+    # Corner holes and the center hole are used to check whether the board has moved
+    anchor_indices = (0, 6, 24, 35, 41)
+    anchor_samples = 12
+    anchor_ring = 1.3
+
+    # Incremental mode: while the grid is locked only cells whose samples changed are reclassified
+    incremental = False
+    change_threshold = 20
+    cell_reference = None
+    resync_frames = 30
+    rejected_board = None
+    rejected_frames = 0
+    move_tracker = None
+    move_events = None
+    frame_index = -1
+
+    # Located mode: a BoardLocator warps each frame to a canonical board, so the holes are constant
+    locator = None
+
+    # Per stage timings, disabled unless a StageTimer is passed in
+    timer = None
+
+    def __init__(self, piece_radius=33, radius_delta=3, tracking=False, drift_threshold=25,
+                 incremental=False, first=None, timer=None, coarse_limit=None, locator=None,
+                 color_table=None) -> None:
         self.piece_radius = piece_radius
         self.radius_delta = radius_delta
-        pass
+        self.coarse_limit = coarse_limit
+        self.tracking = tracking or incremental
+        self.drift_threshold = drift_threshold
+        self.incremental = incremental
+        self.move_tracker = MoveTracker(first)
+        self.timer = timer if timer is not None else StageTimer()
+        self.locator = locator
+        self.color_table = color_table
+        self.reset()
+
+    def reset(self):
+        # Forget the detected board and any locked grid, as if no frame had been seen
+        self.board = np.zeros((6, 7), dtype=int)
+        self.img = None
+        self.circles = None
+        self.piece_colors = None
+        self.grid_residual = None
+        self.piece_confidence = None
+        self.sample_circles = None
+        self.sample_shape = None
+        self.sample_points = None
+        self.tracked_circles = None
+        self.anchor_points = None
+        self.anchor_reference = None
+        self.cell_reference = None
+        self.rejected_board = None
+        self.rejected_frames = 0
+        self.move_events = []
+        self.frame_index = -1
+        self.move_tracker.reset()
 
     def from_image(self, img):
+        if self.locator is not None:
+            with self.timer.stage('locate'):
+                img = self.locator.warp(img)
+            if img is None:
+                raise ValueError('Board not found!')
         self.img = img.copy()
-        self.circles = self.detect_circles(self.img)
-        board = []
-        piece_colors = []
-        
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        for _, (x, y, r) in enumerate(self.circles):
-            x, y, r = int(x), int(y), int(r)
-            pixel = img_rgb[y, x]
-            int_pixel = (int(pixel[2]), int(pixel[1]), int(pixel[0]))
-            if np.all((self.red_low <= pixel) & (pixel <= self.red_high)):
-                piece_colors.append(int_pixel)
-                board.append('R')
-            elif np.all((self.yellow_low <= pixel) & (pixel <= self.yellow_high)):
-                piece_colors.append(int_pixel)
-                board.append('Y')
+        self.frame_index += 1
+        self.move_events = []
+        with self.timer.stage('drift_check'):
+            locked = self.tracking and self.tracked_circles is not None and not self.has_drifted(self.img)
+        if locked:
+            self.circles = self.tracked_circles
+            if self.incremental and self.cell_reference is not None:
+                with self.timer.stage('changed_cells'):
+                    self.update_changed_cells(self.img)
+                return
+        else:
+            if self.locator is not None:
+                self.circles = self.locator.circles
             else:
-                piece_colors.append((255, 255, 255))
-                board.append('O')
-
-        if len(board) != 42:
+                self.circles = self.detect_circles(self.img)
+            if self.tracking:
+                self.lock_grid(self.img, self.circles)
+        if len(self.circles) != 42:
             raise ValueError('Incorrect number of discs found!')
-        
-        self.board = np.array(board).reshape(6, 7)
-        self.piece_colors = piece_colors
+
+        with self.timer.stage('classify'):
+            samples = self.img[self.sample_index(self.img, self.circles)]
+            board, self.piece_colors, self.piece_confidence = self.classify_samples(samples)
+        self.board = board.reshape(6, 7)
+        if self.incremental:
+            # A full detection is trusted, so the tracker follows it even if it is not a legal move
+            self.cell_reference = samples.astype(np.int16)
+            self.move_events = self.move_tracker.update(self.board, self.frame_index, resync=True)
         return
-    
+
+    def frame_circles(self):
+        # The circles in the coordinates of the frame given to from_image, which differ from
+        # circles when a locator warped it
+        if self.locator is None or self.circles is None:
+            return self.circles
+        return self.locator.unwarp_circles(self.circles)
+
+    def update_changed_cells(self, img):
+        samples = img[self.sample_points]
+        difference = np.abs(samples.astype(np.int16) - self.cell_reference).mean(axis=(1, 2))
+        changed = np.flatnonzero(difference > self.change_threshold)
+        if len(changed) == 0:
+            return
+
+        cells, colors, confidence = self.classify_samples(samples[changed])
+        board = self.board.copy()
+        board.flat[changed] = cells
+        if not np.array_equal(board, self.board):
+            # Impossible transitions, such as a hand passing over the board, are rejected and
+            # the cells are checked again on the next frame. A board that stays the same for
+            # resync_frames frames is real, for example two moves made between frames.
+            if self.rejected_board is not None and np.array_equal(board, self.rejected_board):
+                self.rejected_frames += 1
+            else:
+                self.rejected_board, self.rejected_frames = None, 0
+            resync = self.rejected_frames >= self.resync_frames
+            self.move_events = self.move_tracker.update(board, self.frame_index, resync=resync)
+            if not self.move_events and not resync:
+                self.rejected_board = board
+                return
+        self.rejected_board, self.rejected_frames = None, 0
+        self.board = board
+        self.piece_colors = list(self.piece_colors)
+        for idx, color in zip(changed, colors):
+            self.piece_colors[idx] = color
+        self.piece_confidence = self.piece_confidence.copy()
+        self.piece_confidence[changed] = confidence
+        self.cell_reference[changed] = samples[changed]
+
+    def sample_index(self, img, circles):
+        # The disc shaped sampling region is the same for every circle, so the pixel indices of
+        # all cells are built once per grid and reused while the grid is unchanged.
+        if circles is self.sample_circles and img.shape[:2] == self.sample_shape:
+            return self.sample_points
+        centers = np.array([(x, y) for x, y, _ in circles], dtype=float)
+        radius = np.median([r for _, _, r in circles]) * self.sample_ratio
+        step = max(1, int(radius / self.sample_steps))
+        offsets = np.arange(-int(radius), int(radius) + 1, step)
+        dx, dy = np.meshgrid(offsets, offsets)
+        inside = dx * dx + dy * dy <= radius * radius
+        dx, dy = dx[inside], dy[inside]
+        xs = np.clip(np.rint(centers[:, 0:1] + dx).astype(int), 0, img.shape[1] - 1)
+        ys = np.clip(np.rint(centers[:, 1:2] + dy).astype(int), 0, img.shape[0] - 1)
+        self.sample_circles = circles
+        self.sample_shape = img.shape[:2]
+        self.sample_points = (ys, xs)
+        return self.sample_points
+
+    def classify_circles(self, img, circles):
+        # Gather the disc region of every cell at once
+        return self.classify_samples(img[self.sample_index(img, circles)])
+
+    def classify_samples(self, samples):
+        if self.color_table is not None:
+            return self.classify_samples_table(samples)
+        # Flip the samples from BGR to the RGB of the bounds
+        samples = samples[..., ::-1]
+        red = np.all((self.red_low <= samples) & (samples <= self.red_high), axis=2)
+        yellow = np.all((self.yellow_low <= samples) & (samples <= self.yellow_high), axis=2) & ~red
+        empty = ~(red | yellow)
+
+        # The median colour of each cell ignores specular highlights and edge pixels
+        medians = np.median(samples, axis=1)
+        is_red = np.all((self.red_low <= medians) & (medians <= self.red_high), axis=1)
+        is_yellow = ~is_red & np.all((self.yellow_low <= medians) & (medians <= self.yellow_high), axis=1)
+        board = np.where(is_red, 'R', np.where(is_yellow, 'Y', 'O'))
+
+        # The confidence is the share of sampled pixels that agree with the cell's class
+        confidence = np.where(is_red, red.mean(axis=1), np.where(is_yellow, yellow.mean(axis=1), empty.mean(axis=1)))
+        piece_colors = [(int(b), int(g), int(r)) if cls != 'O' else (255, 255, 255)
+                        for (r, g, b), cls in zip(medians, board)]
+        return board, piece_colors, confidence
+
+    def classify_samples_table(self, samples):
+        # Every sample is classified by one lookup and each cell takes the class most of its
+        # samples have, which like the median ignores highlights and edge pixels
+        classes = self.color_table.classify(samples)
+        votes = np.stack([(classes == code).sum(axis=1) for code in range(3)], axis=1)
+        codes = votes.argmax(axis=1)
+        board = np.array(['O', 'R', 'Y'])[codes]
+        confidence = votes[np.arange(len(codes)), codes] / classes.shape[1]
+        means = samples.mean(axis=1)
+        piece_colors = [(int(b), int(g), int(r)) if cls != 'O' else (255, 255, 255)
+                        for (b, g, r), cls in zip(means, board)]
+        return board, piece_colors, confidence
+
+    def lock_grid(self, img, circles):
+        if len(circles) != 42:
+            self.unlock_grid()
+            return
+        # Sample points on a ring around each anchor hole, which lands on the board frame
+        # between the holes and so does not change when discs are dropped in.
+        angles = np.linspace(0, 2 * np.pi, self.anchor_samples, endpoint=False)
+        anchors = np.array([circles[idx] for idx in self.anchor_indices], dtype=float)
+        ring = anchors[:, 2:3] * self.anchor_ring
+        xs = np.rint(anchors[:, 0:1] + ring * np.cos(angles)).astype(int).ravel()
+        ys = np.rint(anchors[:, 1:2] + ring * np.sin(angles)).astype(int).ravel()
+        if xs.min() < 0 or ys.min() < 0 or xs.max() >= img.shape[1] or ys.max() >= img.shape[0]:
+            self.unlock_grid()
+            return
+        self.tracked_circles = circles
+        self.anchor_points = (ys, xs)
+        self.anchor_reference = self.sample_gray(img, self.anchor_points)
+
+    def unlock_grid(self):
+        self.tracked_circles = None
+        self.anchor_points = None
+        self.anchor_reference = None
+
+    def has_drifted(self, img):
+        if self.anchor_points is None:
+            return True
+        ys, xs = self.anchor_points
+        if ys.max() >= img.shape[0] or xs.max() >= img.shape[1]:
+            return True
+        samples = self.sample_gray(img, self.anchor_points)
+        return np.mean(np.abs(samples - self.anchor_reference)) > self.drift_threshold
+
+    def sample_gray(self, img, points):
+        # Only the sampled pixels are converted to grayscale, using the BGR weights of cv2
+        return img[points].astype(np.float32) @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
     def circles_overlap(self, circle1, circle2):
         x1, y1, r1 = circle1
         x2, y2, r2 = circle2
@@ -57,23 +287,29 @@ class Connect4:
         return distance < (r1 + r2)
 
     def remove_overlapping_circles(self, circles):
-        non_overlapping_circles = []
-        for circle in circles:
-            overlap = False
-            for other_circle in non_overlapping_circles:
-                if self.circles_overlap(circle, other_circle):
-                    overlap = True
-                    if circle[2] < other_circle[2]:  # If current circle is smaller, replace the other_circle
-                        non_overlapping_circles.remove(other_circle)
-                        non_overlapping_circles.append(tuple(circle))
-                    break
-            if not overlap:
-                non_overlapping_circles.append(tuple(circle))
-        return non_overlapping_circles
+        circles = np.asarray(circles, dtype=np.float32).reshape(-1, 3)
+        # Visit the circles from smallest to largest, so of two overlapping circles the smaller is kept
+        order = np.argsort(circles[:, 2], kind='stable')
+        x, y, r = circles[order].T
+        dx = x[:, None] - x[None, :]
+        dy = y[:, None] - y[None, :]
+        overlap = dx * dx + dy * dy < (r[:, None] + r[None, :]) ** 2
+
+        keep = np.zeros(len(circles), dtype=bool)
+        suppressed = np.zeros(len(circles), dtype=bool)
+        for idx in range(len(circles)):
+            if not suppressed[idx]:
+                keep[idx] = True
+                suppressed |= overlap[idx]
+        return [tuple(circle) for circle in circles[np.sort(order[keep])]]
     
     def detect_circles(self, img):
+        if self.coarse_limit is not None and max(img.shape[:2]) > self.coarse_limit:
+            return self.detect_circles_coarse(img)
+
         # Convert the image to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        with self.timer.stage('grayscale'):
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
         # Set minimum and maximum radius of the circles to detect
         min_radius = self.piece_radius - self.radius_delta
@@ -82,79 +318,116 @@ class Connect4:
         average_radius = int(average_radius)
 
         # Use Hough Transform to detect circles
-        circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, dp=1, minDist=average_radius, param1=200, param2=20,
-                                minRadius=min_radius, maxRadius=max_radius)
+        with self.timer.stage('hough'):
+            circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, dp=1, minDist=average_radius, param1=200, param2=self.hough_param2,
+                                    minRadius=min_radius, maxRadius=max_radius)
         if circles is None:
             raise ValueError('No circles found!')
-        if len(circles[0]) != 42:
-            raise ValueError('Incorrect number of circles found!')
 
-        # Convert circles to list of tuples and remove overlapping circles
-        circles_list = [tuple(circle) for circle in circles[0]]
-        non_overlapping_circles = self.remove_overlapping_circles(circles_list)
+        # Remove overlapping circles before counting, so a looser param2 can be used on noisy frames
+        with self.timer.stage('overlap'):
+            non_overlapping_circles = self.remove_overlapping_circles(circles[0])
+        if len(non_overlapping_circles) != 42:
+            raise ValueError('Incorrect number of circles found!')
         circles = np.array([non_overlapping_circles])
 
-        # Cluster the y-coordinates to determine distinct rows
-        kmeans = KMeans(n_clusters=6, n_init=10)  # Assuming 6 rows in Connect 4
-        y_coords = circles[0][:, 1].reshape(-1, 1)
-        kmeans.fit(y_coords)
-
-        # Get and sort the cluster centers
-        sorted_centers = sorted([(center[0], idx) for idx, center in enumerate(kmeans.cluster_centers_)])
-
-        # Create a mapping from original cluster label to sorted order
-        label_map = {original_idx: sorted_idx for sorted_idx, (_, original_idx) in enumerate(sorted_centers)}
-
-        # Use the label_map to get labels in sorted order
-        labels = [label_map[label] for label in kmeans.labels_]
-
-        # Sort by the new labels (rows) and then by x-coordinate within each row
-        sorted_circles = [circle for _, circle in sorted(zip(labels, circles[0]), key=lambda c: (c[0], c[1][0]))]
-        return sorted_circles
-
-    def check_winner(board):
-        patterns = ['RRRR', 'YYYY']
-        # Check rows
-        for row in board:
-            for pattern in patterns:
-                if pattern in ''.join(row):
-                    return pattern[0]
-        # Check columns
-        for col in board.T:
-            for pattern in patterns:
-                if pattern in ''.join(col):
-                    return pattern[0]
-        # Check diagonals
-        diagonals = [board.diagonal(i) for i in range(-3, 4)]
-        antidiagonals = [np.fliplr(board).diagonal(i) for i in range(-3, 4)]
-        for diagonal in diagonals + antidiagonals:
-            for pattern in patterns:
-                if pattern in ''.join(diagonal):
-                    return pattern[0]
-        return None
+        # Fit the circles to the 6x7 board lattice to sort them into rows and columns
+        return self.fit_circles(circles[0])
+
+    def detect_circles_coarse(self, img):
+        # Find the grid on a downscaled copy, with the radius range scaled to match
+        with self.timer.stage('downscale'):
+            scaler = Scaler(img, self.coarse_limit, copy=False)
+            scale = scaler.get_scale_percent()
+            small = cv2.cvtColor(scaler.get_scaled_image(), cv2.COLOR_BGR2GRAY)
+        radius = self.piece_radius * scale
+        delta = max(1, int(np.ceil(self.radius_delta * scale)))
+        min_radius = max(1, int(round(radius)) - delta)
+        max_radius = int(round(radius)) + delta
+
+        with self.timer.stage('hough'):
+            circles = cv2.HoughCircles(small, cv2.HOUGH_GRADIENT, dp=1, minDist=int(radius), param1=200, param2=self.hough_param2,
+                                    minRadius=min_radius, maxRadius=max_radius)
+        if circles is None:
+            raise ValueError('No circles found!')
+        with self.timer.stage('overlap'):
+            non_overlapping_circles = self.remove_overlapping_circles(circles[0])
+        if len(non_overlapping_circles) != 42:
+            raise ValueError('Incorrect number of circles found!')
+
+        # Refine each hole at full resolution, keeping the scaled up estimate if the window finds nothing
+        with self.timer.stage('refine'):
+            refined = [self.refine_circle(img, np.array(circle) / scale, 1 / scale) for circle in non_overlapping_circles]
+
+        return self.fit_circles(refined)
+
+    def fit_circles(self, circles):
+        with self.timer.stage('grid_fit'):
+            fit = fit_grid(circles)
+        self.grid_residual = fit.residual
+        radius = np.median([r for _, _, r in fit.circles])
+        if fit.residual > self.max_grid_residual * radius:
+            raise ValueError('Circles do not fit the grid!')
+        return fit.circles
+
+    def refine_circle(self, img, circle, error):
+        # The coarse circle is only off by about one coarse pixel, so the window and radius
+        # range only need to cover that error
+        x, y, r = circle
+        delta = int(np.ceil(error)) + 1
+        reach = int(np.ceil(r)) + delta + self.refine_margin
+        x0, y0 = max(0, int(x) - reach), max(0, int(y) - reach)
+        x1, y1 = min(img.shape[1], int(x) + reach + 1), min(img.shape[0], int(y) + reach + 1)
+        window = cv2.cvtColor(img[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        candidates = cv2.HoughCircles(window, cv2.HOUGH_GRADIENT, dp=1, minDist=int(r), param1=200,
+                                      param2=self.hough_param2, minRadius=int(r) - delta,
+                                      maxRadius=int(r) + delta)
+        if candidates is None:
+            return np.array([x, y, r], dtype=np.float32)
+        candidates = candidates[0] + np.array([x0, y0, 0], dtype=np.float32)
+        distances = np.hypot(candidates[:, 0] - x, candidates[:, 1] - y)
+        best = candidates[np.argmin(distances)]
+        if distances.min() > delta + self.refine_margin:
+            return np.array([x, y, r], dtype=np.float32)
+        return best
+
+    def check_winner(self, board=None):
+        if board is None:
+            board = self.board
+        return Bitboard.from_board(board).winner()
     
-    def draw_circles(self):
-        circles_img = self.img.copy()
+    def draw_circles(self, img=None, scale=1.0):
+        # Draw onto img in place if given, scaling the circles to its size
+        circles_img = self.img.copy() if img is None else img
+        thickness = max(1, int(round(2 * scale)))
         for idx, (x, y, r) in enumerate(self.circles):
-            x, y, r = int(x), int(y), int(r)
-            cv2.circle(circles_img, (x, y), r, (0, 255, 0), 2)  # draw the circle in green
+            x, y, r = int(x * scale), int(y * scale), int(r * scale)
+            cv2.circle(circles_img, (x, y), r, (0, 255, 0), thickness)  # draw the circle in green
             text = str(idx + 1)
-            cv2.putText(circles_img, text, (x - 10, y + 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+            cv2.putText(circles_img, text, (x - int(10 * scale), y + int(10 * scale)), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.9 * scale, (0, 255, 0), thickness)
         return circles_img
     
-    def draw_circle_colors(self):
-        circles_img = self.img.copy()
+    def draw_circle_colors(self, img=None, scale=1.0):
+        circles_img = self.img.copy() if img is None else img
         for idx, (x, y, r) in enumerate(self.circles):
-            x, y, r = int(x), int(y), int(r)
+            x, y, r = int(x * scale), int(y * scale), int(r * scale)
             cv2.circle(circles_img, (x, y), r, self.piece_colors[idx], -1)
         return circles_img
 
-    def draw_board_state(self):
-        board_img = np.ones((300, 350, 3), dtype=np.uint8) * 255  # Assuming 50x50 pixels per cell
+    def draw_board_state(self, img=None):
+        if img is None:
+            board_img = np.ones((300, 350, 3), dtype=np.uint8) * 255  # Assuming 50x50 pixels per cell
+        else:
+            board_img = img
+            board_img[:] = 255
+        cell_width = board_img.shape[1] / 7
+        cell_height = board_img.shape[0] / 6
         for idx, color in enumerate(self.piece_colors):
             row = idx // 7
             col = idx % 7
             if np.all(color == 0):
                 continue
-            cv2.rectangle(board_img, (col*50, row*50), ((col+1)*50, (row+1)*50), color, -1)
-        return board_img
\ No newline at end of file
+            cv2.rectangle(board_img, (int(col * cell_width), int(row * cell_height)),
+                          (int((col + 1) * cell_width), int((row + 1) * cell_height)), color, -1)
+        return board_img
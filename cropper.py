@@ -1,7 +1,8 @@
 import scaler
 import cv2
+import json
 import numpy as np
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 class Cropper:
     """
@@ -30,7 +31,7 @@ class Cropper:
 
     Methods:
     --------
-    __init__(self, image: np.ndarray) -> None
+    __init__(self, image: np.ndarray, copy: bool = True) -> None
         Initializes the Cropper object with an image.
     shape_selection_handler(self, event: int, x: int, y: int, flags: int, param: int) -> None
         A callback function for mouse events. This function is called when the user clicks
@@ -66,7 +67,7 @@ class Cropper:
     crop_img: np.ndarray = None
     cropped_img: np.ndarray = None
 
-    def __init__(self, image: np.ndarray) -> None:
+    def __init__(self, image: np.ndarray, copy: bool = True) -> None:
         """
         Initializes the Cropper object with an image.
 
@@ -74,14 +75,27 @@ class Cropper:
         -----------
         image : numpy.ndarray
             The image to be cropped.
+        copy : bool, optional
+            If False, the image is not copied and is only scaled if it is larger than the scale
+            limit. The image drawn on while selecting is then only made when crop_image() is
+            called. Default is True.
         """
         self.roi = []
-        self.initial_img = image.copy()
-        self.scaler = scaler.Scaler(self.initial_img)
-        self.scaler.scale_image()
-        self.scaled_img = self.scaler.get_scaled_image()
-        self.crop_img = self.scaled_img.copy()
-        self.cropped_img = self.scaled_img.copy()
+        if copy:
+            self.initial_img = image.copy()
+            self.scaler = scaler.Scaler(self.initial_img)
+            self.scaler.scale_image()
+            self.scaled_img = self.scaler.get_scaled_image()
+            self.crop_img = self.scaled_img.copy()
+            self.cropped_img = self.scaled_img.copy()
+        else:
+            self.initial_img = image
+            self.scaler = scaler.Scaler(self.initial_img, copy=False)
+            self.scaled_img = self.scaler.get_scaled_image()
+            if self.scaled_img is None:
+                self.scaled_img = self.initial_img
+            self.crop_img = None
+            self.cropped_img = self.scaled_img
 
     def shape_selection_handler(self, event: int, x: int, y: int, flags: int, param: int) -> None:
         """
@@ -113,6 +127,8 @@ class Cropper:
         Displays the image and waits for the user to select a cropping rectangle. The user
         can press 'r' to reset the rectangle and 'c' to crop the image.
         """
+        if self.crop_img is None:
+            self.crop_img = self.scaled_img.copy()
         cv2.namedWindow("Crop Image")
         cv2.setMouseCallback("Crop Image", self.shape_selection_handler)
         while True:
@@ -169,4 +185,39 @@ def crop_image_from_roi(image: np.ndarray, roi: List[Tuple[int, int]]) -> np.nda
         x_min = max(x_min, 0)
         y_min = max(y_min, 0)
         roi = image[y_min:y_max, x_min:x_max]
-        return roi
\ No newline at end of file
+        return roi
+
+
+def normalize_roi(roi: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    '''
+    Returns the roi as its top-left and bottom-right corners, whichever way it was dragged.
+    '''
+    (x1, y1), (x2, y2) = roi
+    return [(min(x1, x2), min(y1, y2)), (max(x1, x2), max(y1, y2))]
+
+
+def save_roi(path: str, roi: List[Tuple[int, int]], image_shape: Optional[Tuple[int, ...]] = None) -> None:
+    '''
+    Saves a cropping rectangle to a JSON file, along with the size of the image it was selected
+    on so that a different camera resolution can be detected when it is loaded.
+    '''
+    config = {'roi': [list(map(int, point)) for point in normalize_roi(roi)]}
+    if image_shape is not None:
+        config['image_size'] = [int(image_shape[1]), int(image_shape[0])]
+    with open(path, 'w') as f:
+        json.dump(config, f, indent=2)
+
+
+def load_roi(path: str, image_shape: Optional[Tuple[int, ...]] = None) -> List[Tuple[int, int]]:
+    '''
+    Loads a cropping rectangle saved with save_roi(). If image_shape is given and differs from
+    the size the roi was selected on, the roi is scaled to match.
+    '''
+    with open(path) as f:
+        config = json.load(f)
+    roi = [tuple(point) for point in config['roi']]
+    if image_shape is not None and 'image_size' in config:
+        width, height = config['image_size']
+        sx, sy = image_shape[1] / width, image_shape[0] / height
+        roi = [(int(x * sx), int(y * sy)) for x, y in roi]
+    return roi
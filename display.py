@@ -0,0 +1,100 @@
+import cv2
+import numpy as np
+from typing import Optional
+
+
+class DebugDisplay:
+    """
+    Composites the camera frame and the detection results into one 2x2 debug image.
+
+    The output canvas is allocated once and every panel is drawn straight into its quadrant of
+    it: the frame is resized into the top left quadrant, the two circle panels start from a copy
+    of that quadrant and the board panel is only redrawn when the piece colors change. When a
+    frame could not be detected the detection panels are left as they were.
+
+    Attributes
+    ----------
+    scale : float
+        The size of each panel relative to the frame.
+    canvas : numpy.ndarray
+        The output image, reused between frames.
+
+    Methods
+    -------
+    render(frame, connect4=None)
+        Draws a frame and, if given, the detection results of a Connect4 object into the canvas.
+    """
+
+    def __init__(self, scale: float = 0.5) -> None:
+        """
+        Initializes the display.
+
+        Parameters
+        ----------
+        scale : float, optional
+            The size of each panel relative to the frame. Default is 0.5.
+        """
+        self.scale = scale
+        self.canvas = None
+        self.panels = None
+        self.board_colors = None
+
+    def allocate(self, frame: np.ndarray) -> None:
+        """
+        Allocates the canvas for the size of a frame and creates the views of its quadrants.
+        """
+        height = int(round(frame.shape[0] * self.scale))
+        width = int(round(frame.shape[1] * self.scale))
+        self.canvas = np.zeros((height * 2, width * 2, 3), dtype=np.uint8)
+        self.panels = (self.canvas[:height, :width], self.canvas[:height, width:],
+                       self.canvas[height:, :width], self.canvas[height:, width:])
+        self.frame_shape = frame.shape
+        self.board_colors = None
+
+    def render(self, frame: np.ndarray, connect4: Optional[object] = None) -> np.ndarray:
+        """
+        Draws a frame and the detection results into the canvas.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray
+            The camera frame.
+        connect4 : Connect4, optional
+            The detector holding the results for this frame, or None if detection failed.
+
+        Returns
+        -------
+        numpy.ndarray
+            The canvas. It is overwritten by the next call.
+        """
+        first = self.canvas is None or frame.shape != self.frame_shape
+        if first:
+            self.allocate(frame)
+        frame_panel, circles_panel, colors_panel, board_panel = self.panels
+        size = (frame_panel.shape[1], frame_panel.shape[0])
+        cv2.resize(frame, size, dst=frame_panel, interpolation=cv2.INTER_AREA)
+
+        if connect4 is None:
+            if first:
+                # Nothing has been detected yet, so show the frame in every panel
+                for panel in self.panels[1:]:
+                    np.copyto(panel, frame_panel)
+            return self.canvas
+
+        source = connect4.img
+        if source is None or source.shape == frame.shape:
+            scale = size[0] / frame.shape[1]
+            np.copyto(circles_panel, frame_panel)
+        else:
+            # The detector worked on a warped board, which is fitted into the panel instead
+            scale = min(size[0] / source.shape[1], size[1] / source.shape[0])
+            width, height = int(source.shape[1] * scale), int(source.shape[0] * scale)
+            circles_panel[:] = 0
+            cv2.resize(source, (width, height), dst=circles_panel[:height, :width], interpolation=cv2.INTER_AREA)
+        np.copyto(colors_panel, circles_panel)
+        connect4.draw_circles(circles_panel, scale)
+        connect4.draw_circle_colors(colors_panel, scale)
+        if connect4.piece_colors != self.board_colors:
+            connect4.draw_board_state(board_panel)
+            self.board_colors = list(connect4.piece_colors)
+        return self.canvas
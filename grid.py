@@ -0,0 +1,149 @@
+import numpy as np
+from typing import List, NamedTuple
+
+
+class GridFit(NamedTuple):
+    """
+    The result of fitting circles to the board lattice.
+
+    Attributes
+    ----------
+    circles : list of numpy.ndarray
+        The (x, y, r) circles sorted by row from top to bottom, then by column from left to right.
+    cells : numpy.ndarray
+        The (row, col) cell of each sorted circle.
+    residual : float
+        The root mean square distance in pixels between the circles and the fitted lattice.
+        Small values mean the circles sit on a regular grid, so it can be used as a confidence.
+    lattice : numpy.ndarray
+        The 3x2 lattice coefficients, the (x, y) of cell (0, 0), the step of one column and
+        the step of one row.
+    """
+    circles: List[np.ndarray]
+    cells: np.ndarray
+    residual: float
+    lattice: np.ndarray
+
+
+def group_by_gaps(values: np.ndarray, groups: int) -> np.ndarray:
+    """
+    Splits values into groups by cutting at the largest gaps between sorted values.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        The values to group.
+    groups : int
+        The number of groups.
+
+    Returns
+    -------
+    numpy.ndarray
+        The group of each value, numbered in increasing order of value.
+    """
+    order = np.argsort(values, kind='stable')
+    gaps = np.diff(values[order])
+    cuts = np.sort(np.argsort(gaps, kind='stable')[len(gaps) - (groups - 1):])
+    labels = np.empty(len(values), dtype=int)
+    labels[order] = np.searchsorted(cuts, np.arange(len(values)), side='left')
+    return labels
+
+
+def fit_lattice(points: np.ndarray, cells: np.ndarray):
+    """
+    Fits an affine lattice to points with known cells using least squares.
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        The (x, y) coordinates of the points.
+    cells : numpy.ndarray
+        The (row, col) cell of each point.
+
+    Returns
+    -------
+    tuple of (numpy.ndarray, float)
+        The 3x2 lattice coefficients and the root mean square residual in pixels.
+    """
+    design = np.column_stack([np.ones(len(points)), cells[:, 1], cells[:, 0]])
+    lattice = np.linalg.lstsq(design, points, rcond=None)[0]
+    errors = design @ lattice - points
+    residual = float(np.sqrt(np.mean(np.sum(errors ** 2, axis=1))))
+    return lattice, residual
+
+
+def estimate_tilt(points: np.ndarray) -> float:
+    """
+    Estimates the tilt of the lattice in radians from the direction of each point to its nearest
+    neighbour, which is along a row or a column. Angles are folded to a quarter turn, so rows and
+    columns agree, and averaged on the circle.
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        The (x, y) coordinates of the points.
+
+    Returns
+    -------
+    float
+        The tilt between -45 and 45 degrees, in radians.
+    """
+    distances = np.linalg.norm(points[:, None] - points[None], axis=2)
+    np.fill_diagonal(distances, np.inf)
+    offsets = points[distances.argmin(axis=1)] - points
+    angles = 4 * np.arctan2(offsets[:, 1], offsets[:, 0])
+    return float(np.arctan2(np.sin(angles).sum(), np.cos(angles).sum()) / 4)
+
+
+def fit_grid(circles, rows: int = 6, cols: int = 7, iterations: int = 2) -> GridFit:
+    """
+    Assigns each circle to a (row, col) cell of the board and sorts the circles into reading order.
+
+    The tilt of the board is estimated from the nearest neighbours of the circles and undone, and
+    rows and columns are then found by cutting the sorted y and x coordinates at their largest
+    gaps. An affine lattice is fitted to the assignment, and its column direction is used to
+    refine the tilt before the cells are assigned again.
+
+    Parameters
+    ----------
+    circles : array_like
+        The (x, y, r) circles to fit.
+    rows : int, optional
+        The number of rows of the board. Default is 6.
+    cols : int, optional
+        The number of columns of the board. Default is 7.
+    iterations : int, optional
+        The number of times the cells are reassigned after correcting for tilt. Default is 2.
+
+    Returns
+    -------
+    GridFit
+        The sorted circles, their cells and the fit residual.
+
+    Raises
+    ------
+    ValueError
+        If there are too few circles, or the assignment does not put one circle in every cell.
+    """
+    circles = np.asarray(circles, dtype=np.float32).reshape(-1, 3)
+    if len(circles) < max(rows, cols):
+        raise ValueError('Not enough circles to fit the grid!')
+    points = circles[:, :2].astype(float)
+    centered = points - points.mean(axis=0)
+
+    angle = estimate_tilt(points)
+    for _ in range(iterations + 1):
+        cos, sin = np.cos(angle), np.sin(angle)
+        xs = centered[:, 0] * cos + centered[:, 1] * sin
+        ys = centered[:, 1] * cos - centered[:, 0] * sin
+        cells = np.column_stack([group_by_gaps(ys, rows), group_by_gaps(xs, cols)])
+        lattice, residual = fit_lattice(points, cells)
+        angle = np.arctan2(lattice[1, 1], lattice[1, 0])
+
+    # A wrong assignment would scramble the board, so it is an error rather than a poor residual
+    indices = cells[:, 0] * cols + cells[:, 1]
+    if len(circles) != rows * cols or len(np.unique(indices)) != rows * cols:
+        raise ValueError('Circles do not fill the grid!')
+
+    order = np.lexsort((cells[:, 1], cells[:, 0]))
+    return GridFit([circles[idx] for idx in order], cells[order], residual, lattice)
@@ -0,0 +1,211 @@
+import json
+import time
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+
+class _NullStage:
+    """
+    A context manager that does nothing, returned for every stage while timing is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """
+    A context manager that records the time spent in a stage.
+    """
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer: 'StageTimer', name: str) -> None:
+        self.timer = timer
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, time.perf_counter_ns() - self.start)
+        return False
+
+
+class RollingHistogram:
+    """
+    Keeps the most recent durations of a stage in a ring buffer.
+
+    Attributes
+    ----------
+    samples : numpy.ndarray
+        The ring buffer of durations in nanoseconds.
+    count : int
+        The number of durations recorded since the histogram was created.
+    total : int
+        The sum of all durations recorded in nanoseconds.
+    """
+
+    def __init__(self, window: int = 256) -> None:
+        self.samples = np.zeros(window, dtype=np.int64)
+        self.count = 0
+        self.total = 0
+
+    def add(self, duration: int) -> None:
+        self.samples[self.count % len(self.samples)] = duration
+        self.count += 1
+        self.total += duration
+
+    def recent(self) -> np.ndarray:
+        return self.samples[:min(self.count, len(self.samples))]
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Returns the count, last value and the mean and percentiles of the recent durations in milliseconds.
+        """
+        recent = self.recent() / 1e6
+        p50, p90, p99 = np.percentile(recent, (50, 90, 99))
+        last = self.samples[(self.count - 1) % len(self.samples)] / 1e6
+        return {'count': self.count, 'last': float(last), 'mean': float(recent.mean()),
+                'p50': float(p50), 'p90': float(p90), 'p99': float(p99)}
+
+
+class StageTimer:
+    """
+    Times named stages of the detection and display loop.
+
+    Stages are timed with `with timer.stage('name'):` blocks using the monotonic
+    time.perf_counter_ns clock, and the recent durations of each stage are kept in a rolling
+    histogram. While disabled, stage() returns a shared do-nothing context manager, so the
+    instrumentation costs one method call per stage.
+
+    Attributes
+    ----------
+    enabled : bool
+        True if stages are timed.
+    window : int
+        The number of recent durations kept per stage.
+    dump_path : str
+        The JSON file the summary is written to by maybe_dump(), or None.
+    dump_interval : float
+        The minimum time between dumps in seconds.
+
+    Methods
+    -------
+    stage(name)
+        Returns a context manager that times a stage.
+    record(name, duration)
+        Records the duration of a stage in nanoseconds.
+    tick()
+        Marks the end of a frame, used to measure the frame rate.
+    fps()
+        Returns the recent frame rate.
+    summary()
+        Returns the timing summary of every stage.
+    draw_overlay(img)
+        Draws the frame rate and stage timings onto an image.
+    maybe_dump()
+        Writes the summary to dump_path if dump_interval has passed since the last dump.
+    reset()
+        Forgets all recorded durations.
+    """
+
+    def __init__(self, enabled: bool = False, window: int = 256, dump_path: Optional[str] = None,
+                 dump_interval: float = 10.0) -> None:
+        """
+        Initializes the timer.
+
+        Parameters
+        ----------
+        enabled : bool, optional
+            If True, stages are timed. Default is False.
+        window : int, optional
+            The number of recent durations kept per stage. Default is 256.
+        dump_path : str, optional
+            The JSON file maybe_dump() writes the summary to. Default is None, no dumps.
+        dump_interval : float, optional
+            The minimum time between dumps in seconds. Default is 10.
+        """
+        self.enabled = enabled
+        self.window = window
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.histograms: Dict[str, RollingHistogram] = {}
+        self.frames = RollingHistogram(window)
+        self.last_tick = None
+        self.last_dump = time.monotonic()
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name: str, duration: int) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = RollingHistogram(self.window)
+        histogram.add(duration)
+
+    def tick(self) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        if self.last_tick is not None:
+            self.frames.add(now - self.last_tick)
+        self.last_tick = now
+
+    def fps(self) -> float:
+        recent = self.frames.recent()
+        if len(recent) == 0:
+            return 0.0
+        return float(1e9 / recent.mean())
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {name: histogram.summary() for name, histogram in self.histograms.items()}
+
+    def draw_overlay(self, img: np.ndarray) -> np.ndarray:
+        """
+        Draws the frame rate and the median time of every stage onto an image, in place.
+        """
+        if not self.enabled:
+            return img
+        lines = ['%.1f fps' % self.fps()]
+        lines += ['%s %.1f ms' % (name, stats['p50']) for name, stats in self.summary().items()]
+        for idx, line in enumerate(lines):
+            origin = (10, 25 + idx * 22)
+            cv2.putText(img, line, origin, cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 3)
+            cv2.putText(img, line, origin, cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+        return img
+
+    def maybe_dump(self) -> bool:
+        """
+        Writes the summary to dump_path if dump_interval has passed since the last dump.
+
+        Returns
+        -------
+        bool
+            True if the summary was written.
+        """
+        if not self.enabled or self.dump_path is None:
+            return False
+        now = time.monotonic()
+        if now - self.last_dump < self.dump_interval:
+            return False
+        self.last_dump = now
+        with open(self.dump_path, 'w') as f:
+            json.dump({'time': time.time(), 'fps': self.fps(), 'stages': self.summary()}, f, indent=2)
+        return True
+
+    def reset(self) -> None:
+        self.histograms = {}
+        self.frames = RollingHistogram(self.window)
+        self.last_tick = None
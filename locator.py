@@ -0,0 +1,253 @@
+import cv2
+import numpy as np
+from typing import Optional
+
+ROWS = 6
+COLS = 7
+
+
+class BoardLocator:
+    """
+    Finds the board in a camera frame and warps it to a fixed canonical image.
+
+    The board frame is found as the blue region of the frame, and its holes as the roughly
+    circular gaps inside it. Once exactly 42 holes are found they are placed on the lattice and a
+    homography from their centers to the hole centers of the canonical board is estimated. Warping with it gives an image of the board of the same size and with the holes
+    at the same place whatever the camera resolution, distance or angle, so the hole circles are
+    constants.
+
+    The homography is cached. Points on the board frame between the holes are sampled when it is
+    estimated, and it is only estimated again once those samples change, when the board or the
+    camera has moved. The median change is used, so a hand over part of the board does not count.
+
+    Attributes
+    ----------
+    radius : int
+        The hole radius of the canonical board in pixels.
+    spacing : float
+        The distance between neighbouring hole centers as a multiple of the radius.
+    size : tuple of int
+        The (width, height) of the canonical image.
+    circles : numpy.ndarray
+        The 42 (x, y, r) holes of the canonical board in reading order.
+    homography : numpy.ndarray
+        The cached 3x3 transform from the frame to the canonical board, or None.
+    move_threshold : float
+        The median change in gray level of the frame samples above which the board has moved.
+    estimates : int
+        The number of times the homography was estimated.
+
+    Methods
+    -------
+    find_holes(img)
+        Returns the (x, y, r) holes found in the board frame of an image.
+    estimate(img)
+        Estimates the homography of an image, or returns None if the board was not found.
+    has_moved(img)
+        Returns True if the board has moved since the homography was estimated.
+    locate(img)
+        Returns the homography of an image, estimating it again only if the board has moved.
+    warp(img)
+        Returns the board of an image warped to the canonical image, or None if it was not found.
+    unwarp_circles(circles)
+        Returns circles of the canonical image in the coordinates of the located frame.
+    reset()
+        Forgets the cached homography.
+    """
+
+    # The blue of the board frame in OpenCV HSV, with hue from 0 to 180
+    frame_low = np.array([95, 80, 40])
+    frame_high = np.array([135, 255, 255])
+
+    # Gaps in the frame are holes if they are round enough and about the size of the others
+    min_hole_area = 12
+    min_circularity = 0.35
+    radius_ratio = 0.75
+
+    def __init__(self, radius: int = 20, spacing: float = 2.5, move_threshold: float = 25) -> None:
+        """
+        Initializes the locator.
+
+        Parameters
+        ----------
+        radius : int, optional
+            The hole radius of the canonical board in pixels. Default is 20.
+        spacing : float, optional
+            The distance between neighbouring hole centers as a multiple of the radius. Default
+            is 2.5, which leaves half a step of frame around the outer holes.
+        move_threshold : float, optional
+            The median change in gray level of the frame samples above which the board has moved.
+            Default is 25.
+        """
+        self.radius = radius
+        self.spacing = spacing
+        self.move_threshold = move_threshold
+        step = radius * spacing
+        self.size = (int(round(COLS * step)), int(round(ROWS * step)))
+        cols, rows = np.meshgrid(np.arange(COLS), np.arange(ROWS))
+        centers = np.column_stack([(cols.ravel() + 0.5) * step, (rows.ravel() + 0.5) * step])
+        self.centers = centers.astype(np.float32)
+        self.circles = np.column_stack([centers, np.full(len(centers), radius)]).astype(np.float32)
+
+        # The frame between horizontally neighbouring holes, which discs never cover
+        between = (self.centers.reshape(ROWS, COLS, 2)[:, :-1] + self.centers.reshape(ROWS, COLS, 2)[:, 1:]) / 2
+        self.frame_centers = between.reshape(-1, 1, 2).astype(np.float32)
+
+        self.homography = None
+        self.frame_points = None
+        self.frame_reference = None
+        self.canonical = None
+        self.estimates = 0
+
+    def find_holes(self, img: np.ndarray) -> np.ndarray:
+        """
+        Returns the (x, y, r) holes of the blue region with the most holes, the radius being that
+        of a circle with the same area.
+        """
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, self.frame_low, self.frame_high)
+        contours, hierarchy = cv2.findContours(mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return np.zeros((0, 3))
+
+        # With RETR_CCOMP every inner contour is a gap in the blue region that is its parent
+        parents = hierarchy[0][:, 3]
+        holes = {}
+        for idx in np.flatnonzero(parents >= 0):
+            area = cv2.contourArea(contours[idx])
+            perimeter = cv2.arcLength(contours[idx], True)
+            if area < self.min_hole_area or 4 * np.pi * area / perimeter ** 2 < self.min_circularity:
+                continue
+            moments = cv2.moments(contours[idx])
+            hole = (moments['m10'] / moments['m00'], moments['m01'] / moments['m00'], np.sqrt(area / np.pi))
+            holes.setdefault(parents[idx], []).append(hole)
+
+        best = np.zeros((0, 3))
+        for candidates in holes.values():
+            candidates = np.array(candidates)
+            median = np.median(candidates[:, 2])
+            sized = (candidates[:, 2] > median * self.radius_ratio) & (candidates[:, 2] < median / self.radius_ratio)
+            candidates = self.remove_stray_holes(candidates[sized])
+            if abs(len(candidates) - ROWS * COLS) < abs(len(best) - ROWS * COLS):
+                best = candidates
+        return best
+
+    def remove_stray_holes(self, holes: np.ndarray) -> np.ndarray:
+        # Holes of the board have at least two neighbours about one step away, unlike gaps
+        # elsewhere in the region such as the slots of a tray
+        while len(holes) > ROWS * COLS:
+            distances = np.linalg.norm(holes[:, None, :2] - holes[None, :, :2], axis=2)
+            np.fill_diagonal(distances, np.inf)
+            step = np.median(distances.min(axis=1))
+            neighbours = ((distances > 0.75 * step) & (distances < 1.3 * step)).sum(axis=1)
+            if np.all(neighbours >= 2):
+                break
+            holes = holes[neighbours >= 2]
+        return holes
+
+    def estimate(self, img: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Estimates the homography from an image to the canonical board.
+
+        The corner holes are the ones furthest along the diagonals, which holds for boards turned
+        less than 45 degrees. A first homography from the four corners places every hole in a
+        cell, and the homography is then fitted to all 42 holes.
+
+        Returns
+        -------
+        numpy.ndarray
+            The 3x3 homography, or None if the 42 holes of the board were not found.
+        """
+        holes = self.find_holes(img)
+        if len(holes) != ROWS * COLS:
+            return None
+        points = holes[:, :2].astype(np.float32)
+        sums, differences = points.sum(axis=1), points[:, 0] - points[:, 1]
+        corners = points[[sums.argmin(), differences.argmax(), sums.argmax(), differences.argmin()]]
+        corner_centers = self.centers[[0, COLS - 1, ROWS * COLS - 1, (ROWS - 1) * COLS]]
+        homography = cv2.getPerspectiveTransform(corners, corner_centers)
+
+        step = self.radius * self.spacing
+        projected = cv2.perspectiveTransform(points.reshape(-1, 1, 2), homography).reshape(-1, 2)
+        cols, rows = np.floor(projected / step).astype(int).T
+        cells = rows * COLS + cols
+        if (cols.min() < 0 or rows.min() < 0 or cols.max() >= COLS or rows.max() >= ROWS
+                or len(np.unique(cells)) != ROWS * COLS):
+            return None
+        ordered = np.empty_like(points)
+        ordered[cells] = points
+        homography, _ = cv2.findHomography(ordered, self.centers)
+        if homography is None:
+            return None
+
+        # Every hole must land close to its canonical center, or the lattice was not the board
+        projected = cv2.perspectiveTransform(ordered.reshape(-1, 1, 2), homography).reshape(-1, 2)
+        if np.max(np.linalg.norm(projected - self.centers, axis=1)) > self.radius / 2:
+            return None
+        return homography
+
+    def frame_gray(self, img: np.ndarray) -> np.ndarray:
+        ys, xs = self.frame_points
+        return img[ys, xs].astype(np.float32) @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+    def has_moved(self, img: np.ndarray) -> bool:
+        if self.frame_points is None:
+            return True
+        ys, xs = self.frame_points
+        if ys.max() >= img.shape[0] or xs.max() >= img.shape[1]:
+            return True
+        return np.median(np.abs(self.frame_gray(img) - self.frame_reference)) > self.move_threshold
+
+    def locate(self, img: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Returns the homography from an image to the canonical board, estimating it again only if
+        the board has moved, or None if the board was not found.
+        """
+        if self.homography is not None and not self.has_moved(img):
+            return self.homography
+        self.reset()
+        homography = self.estimate(img)
+        self.estimates += 1
+        if homography is None:
+            return None
+
+        points = cv2.perspectiveTransform(self.frame_centers, np.linalg.inv(homography)).reshape(-1, 2)
+        xs, ys = np.rint(points).astype(int).T
+        if xs.min() < 0 or ys.min() < 0 or xs.max() >= img.shape[1] or ys.max() >= img.shape[0]:
+            return None
+        self.homography = homography
+        self.frame_points = (ys, xs)
+        self.frame_reference = self.frame_gray(img)
+        return homography
+
+    def warp(self, img: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Returns the board of an image warped to the canonical image, or None if it was not found.
+        The returned image is reused by the next call.
+        """
+        homography = self.locate(img)
+        if homography is None:
+            return None
+        if self.canonical is None:
+            self.canonical = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+        return cv2.warpPerspective(img, homography, self.size, dst=self.canonical, flags=cv2.INTER_LINEAR)
+
+    def unwarp_circles(self, circles: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Returns (x, y, r) circles of the canonical image in the coordinates of the frame the
+        homography was estimated on, or None if there is no homography. The radius is the mean
+        distance from the center to the points one radius to its right and below.
+        """
+        if self.homography is None:
+            return None
+        circles = np.asarray(circles, dtype=np.float32).reshape(-1, 3)
+        x, y, r = circles.T
+        points = np.concatenate([np.column_stack([x, y]), np.column_stack([x + r, y]), np.column_stack([x, y + r])])
+        points = cv2.perspectiveTransform(points.reshape(-1, 1, 2), np.linalg.inv(self.homography)).reshape(3, -1, 2)
+        radius = (np.linalg.norm(points[1] - points[0], axis=1) + np.linalg.norm(points[2] - points[0], axis=1)) / 2
+        return np.column_stack([points[0], radius]).astype(np.float32)
+
+    def reset(self) -> None:
+        self.homography = None
+        self.frame_points = None
+        self.frame_reference = None
@@ -1,67 +1,202 @@
 from webcam import Webcam
 from connect4 import Connect4
+from instrumentation import StageTimer
+from cropper import Cropper, crop_image_from_roi, load_roi, save_roi
+from display import DebugDisplay
+from announcer import Announcer, StdoutSink, make_sink
+from locator import BoardLocator
+from server import BoardServer
+from recording import Recorder
+from colortable import ColorTable, camera_path
+import json
+import os
+import sys
+import time
 import cv2
-import numpy as np
-from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtWidgets import QApplication, QLabel, QWidget, QVBoxLayout
 
-def main():
+def main(profile=False, dump_path=None, roi_path=None, select_roi=False, announce=None, locate=False, serve=None,
+         record=None, colors=None, coarse_limit=None):
     # Create a new webcam object
-    webcam = Webcam()
+    webcam = Webcam(threaded=True)
     opened = webcam.open()
     if not opened:
         print('Error opening webcam')
-        return
+        return 1
 
-    connect4 = Connect4()
+    # Time each stage of the loop when profiling, shown on screen and dumped to a file, or when
+    # serving, so clients get the stage timings as health data
+    timer = StageTimer(enabled=profile or serve is not None, dump_path=dump_path)
+    # With locate, the board is found and warped automatically instead of relying on a fixed radius
+    locator = BoardLocator() if locate else None
+    # Disc colors are classified with the table calibrated for this camera when there is one
+    colors = colors or camera_path(0)
+    color_table = ColorTable.load(colors) if os.path.exists(colors) else None
+    # Large frames are searched for the grid downscaled to coarse_limit pixels, then refined
+    connect4 = Connect4(tracking=True, timer=timer, locator=locator, color_table=color_table,
+                        coarse_limit=coarse_limit)
 
-    # Images to render on the screen
-    frame = None
-    detected_circles = None
-    detected_circle_colors = None
-    detected_color = None
+    # Crop every frame to the saved board region, selecting and saving it first if asked to
+    roi = None
+    if select_roi and roi_path is not None:
+        frame = webcam.get_frame()
+        cropper = Cropper(frame, copy=False)
+        cropper.crop_image() # blocking call
+        if len(cropper.get_roi()) == 2:
+            save_roi(roi_path, cropper.get_roi(), frame.shape)
+    # The saved roi is loaded on the first frame, so it is scaled if the camera resolution changed
+    load_saved_roi = roi_path is not None and os.path.exists(roi_path)
+
+    # Board changes are spoken and served to clients on their own threads so they never hold up
+    # the frame loop
+    announcer = Announcer(make_sink(announce)).start() if announce else None
+    server = BoardServer(*serve).start() if serve else None
+    # Every frame and its detection are recorded so the session can be replayed through the detector
+    recorder = Recorder(record, connect4) if record else None
+
+    # The 2x2 debug image is drawn into one canvas that is reused every frame
+    display = DebugDisplay()
     output = None
     
     while True:
-        frame = webcam.get_frame()
-
-        # First time through the loop, initialize the images
-        if detected_circles is None:
-            detected_circles = frame.copy()
-            detected_circle_colors = frame.copy()
-            detected_color = frame.copy()
+        with timer.stage('capture'):
+            frame = webcam.get_frame()
+        if frame is None:
+            print('Error reading frame from webcam')
+            break
+        if load_saved_roi:
+            roi = load_roi(roi_path, frame.shape)
+            load_saved_roi = False
+        if roi is not None:
+            # A view into the frame, so cropping does not copy any pixels
+            frame = crop_image_from_roi(frame, roi)
 
+        detected = None
+        start = time.perf_counter()
         try :
-            connect4.from_image(frame)
-            detected_circles = connect4.draw_circles()
-            detected_circle_colors = connect4.draw_circle_colors()
-            detected_color = connect4.draw_board_state()
+            with timer.stage('detect'):
+                connect4.from_image(frame)
+            detected = connect4
+            if announcer is not None:
+                announcer.update(connect4)
+            if server is not None:
+                server.publish_connect4(connect4)
         
         except ValueError as e:
             print(e)
+        if recorder is not None:
+            with timer.stage('record'):
+                recorder.write(frame, connect4, detected is not None, detect_time=time.perf_counter() - start)
 
-        # Reduce the size of the image to fit on the screen
-        frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
+        with timer.stage('composite'):
+            # Panels are only redrawn when there is a new detection to show
+            output = display.render(frame, detected)
+            if profile:
+                timer.draw_overlay(output)
 
-        # Resize the detected circles image to be the same size as the original image
-        detected_circles = cv2.resize(detected_circles, (frame.shape[1], frame.shape[0]))
-        detected_circle_colors = cv2.resize(detected_circle_colors, (frame.shape[1], frame.shape[0]))
-        detected_color = cv2.resize(detected_color, (frame.shape[1], frame.shape[0]))
+        with timer.stage('display'):
+            cv2.imshow('frame', output)
+            key = cv2.waitKey(1) & 0xFF
+        timer.tick()
+        if server is not None:
+            server.publish_health(timer)
+        timer.maybe_dump()
 
-        # Stack the images onto a single image
-        top = np.hstack([frame, detected_circles])
-        bottom = np.hstack([detected_circle_colors, detected_color])
-        output = np.vstack([top, bottom])
-        cv2.imshow('frame', output)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if key == ord('q'):
             break
 
     # Release the capture
     webcam.close()
+    if announcer is not None:
+        announcer.stop()
+    if server is not None:
+        server.stop()
+    if recorder is not None:
+        recorder.close()
     cv2.destroyAllWindows()
 
-if __name__ == '__main__':
-    main()
+def headless(roi_path=None, output=None, profile=False, dump_path=None, announce=None, locate=False, serve=None,
+             record=None, colors=None, coarse_limit=None):
+    # Detect without any windows, writing the board as a JSON line each time it changes
+    webcam = Webcam(threaded=True)
+    if not webcam.open():
+        print('Error opening webcam', file=sys.stderr)
+        return 1
+
+    timer = StageTimer(enabled=profile or serve is not None, dump_path=dump_path)
+    locator = BoardLocator() if locate else None
+    colors = colors or camera_path(0)
+    color_table = ColorTable.load(colors) if os.path.exists(colors) else None
+    connect4 = Connect4(tracking=True, timer=timer, locator=locator, color_table=color_table,
+                        coarse_limit=coarse_limit)
+    roi = None
+    load_saved_roi = roi_path is not None and os.path.exists(roi_path)
 
+    announcer = None
+    if announce:
+        sink = make_sink(announce)
+        if isinstance(sink, StdoutSink) and not output:
+            # The board records are written to stdout, so announcements must not be mixed in
+            sink.stream = sys.stderr
+        announcer = Announcer(sink).start()
+    server = BoardServer(*serve).start() if serve else None
+    recorder = Recorder(record, connect4) if record else None
+    out = open(output, 'w') if output else sys.stdout
+    last_board = None
+    frame_index = 0
+    try:
+        while True:
+            with timer.stage('capture'):
+                frame = webcam.get_frame()
+            if frame is None:
+                # Exit with an error so a supervisor can restart us after a camera fault
+                print('Error reading frame from webcam', file=sys.stderr)
+                return 1
+            if load_saved_roi:
+                roi = load_roi(roi_path, frame.shape)
+                load_saved_roi = False
+            if roi is not None:
+                frame = crop_image_from_roi(frame, roi)
 
+            detected = False
+            start = time.perf_counter()
+            try:
+                with timer.stage('detect'):
+                    connect4.from_image(frame)
+                detected = True
+                if announcer is not None:
+                    announcer.update(connect4)
+                if server is not None:
+                    server.publish_connect4(connect4)
+                board = connect4.board.tolist()
+                if board != last_board:
+                    change = {'frame': frame_index, 'time': time.time(), 'board': board,
+                              'winner': connect4.check_winner()}
+                    out.write(json.dumps(change) + '\n')
+                    out.flush()
+                    last_board = board
+            except ValueError:
+                pass
+            if recorder is not None:
+                with timer.stage('record'):
+                    recorder.write(frame, connect4, detected, detect_time=time.perf_counter() - start)
+            frame_index += 1
+            timer.tick()
+            if server is not None:
+                server.publish_health(timer)
+            timer.maybe_dump()
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        webcam.close()
+        if announcer is not None:
+            announcer.stop()
+        if server is not None:
+            server.stop()
+        if recorder is not None:
+            recorder.close()
+        if output:
+            out.close()
+
+if __name__ == '__main__':
+    import cli
+    sys.exit(cli.main(['live'] + sys.argv[1:]))
@@ -0,0 +1,149 @@
+import numpy as np
+from typing import List, NamedTuple, Optional
+
+
+class MoveEvent(NamedTuple):
+    """
+    A disc that was dropped into the board.
+
+    Attributes
+    ----------
+    column : int
+        The column of the disc, from 0 on the left to 6 on the right.
+    row : int
+        The row the disc landed in, from 0 at the top to 5 at the bottom.
+    color : str
+        The color of the disc, 'R' or 'Y'.
+    frame_index : int
+        The index of the frame the disc was first seen in.
+    """
+    column: int
+    row: int
+    color: str
+    frame_index: int
+
+
+class MoveTracker:
+    """
+    Turns a sequence of detected boards into a stream of move events.
+
+    A new board is accepted if it is the same as the current board or adds exactly one disc that
+    rests on the bottom or on another disc and has the color of the player to move. Any other
+    transition is rejected and the current board is kept.
+
+    Attributes
+    ----------
+    board : numpy.ndarray
+        The last accepted board, None until the first board is seen.
+    first : str
+        The player that moves first, 'R' or 'Y', or None if either may start.
+    events : list of MoveEvent
+        Every move accepted so far.
+    rejected : int
+        The number of boards that were rejected.
+    resyncs : int
+        The number of times an invalid board was adopted because resync was requested.
+
+    Methods
+    -------
+    reset(board=None)
+        Forgets the move history and starts again from a board.
+    expected_color()
+        Returns the color of the player to move, or None if either may move.
+    update(board, frame_index, resync=False)
+        Checks a new board and returns the moves it adds.
+    is_valid()
+        Returns True if the current board could have been reached by legal moves.
+    """
+
+    def __init__(self, first: Optional[str] = None) -> None:
+        """
+        Initializes the tracker.
+
+        Parameters
+        ----------
+        first : str, optional
+            The player that moves first, 'R' or 'Y'. Default is None, either may start.
+        """
+        self.first = first
+        self.board = None
+        self.events: List[MoveEvent] = []
+        self.rejected = 0
+        self.resyncs = 0
+
+    def reset(self, board: Optional[np.ndarray] = None) -> None:
+        """
+        Forgets the move history and starts again from a board.
+        """
+        self.board = None if board is None else np.array(board)
+        self.events = []
+
+    def expected_color(self) -> Optional[str]:
+        """
+        Returns the color of the player to move, or None if either may move.
+        """
+        red = np.count_nonzero(self.board == 'R')
+        yellow = np.count_nonzero(self.board == 'Y')
+        if red > yellow:
+            return 'Y'
+        if yellow > red:
+            return 'R'
+        return self.first
+
+    def update(self, board: np.ndarray, frame_index: int, resync: bool = False) -> List[MoveEvent]:
+        """
+        Checks a new board and returns the moves it adds.
+
+        Parameters
+        ----------
+        board : numpy.ndarray
+            The detected 6x7 board of 'R', 'Y' and 'O'.
+        frame_index : int
+            The index of the frame the board was detected in.
+        resync : bool, optional
+            If True, a board that is not a valid transition replaces the current board instead of
+            being rejected. Use this for boards from a full detection. Default is False.
+
+        Returns
+        -------
+        list of MoveEvent
+            The move added by the board, or an empty list if there was none or it was rejected.
+        """
+        board = np.asarray(board)
+        if self.board is None:
+            self.board = board.copy()
+            return []
+
+        changed = np.argwhere(board != self.board)
+        if len(changed) == 0:
+            return []
+        if len(changed) == 1:
+            row, col = changed[0]
+            color = board[row, col]
+            expected = self.expected_color()
+            resting = row == board.shape[0] - 1 or board[row + 1, col] != 'O'
+            if (self.board[row, col] == 'O' and color in ('R', 'Y') and resting
+                    and (expected is None or color == expected)):
+                self.board = board.copy()
+                event = MoveEvent(int(col), int(row), str(color), frame_index)
+                self.events.append(event)
+                return [event]
+
+        if resync:
+            self.board = board.copy()
+            self.resyncs += 1
+        else:
+            self.rejected += 1
+        return []
+
+    def is_valid(self) -> bool:
+        """
+        Returns True if the current board could have been reached by legal moves.
+        """
+        if self.board is None:
+            return True
+        occupied = self.board != 'O'
+        # Every disc must rest on the bottom or on another disc.
+        if np.any(occupied[:-1] & ~occupied[1:]):
+            return False
+        return abs(np.count_nonzero(self.board == 'R') - np.count_nonzero(self.board == 'Y')) <= 1
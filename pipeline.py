@@ -0,0 +1,362 @@
+import argparse
+import json
+import multiprocessing as mp
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from connect4 import Connect4
+from display import DebugDisplay
+from webcam import Webcam
+
+
+def frame_view(shm: shared_memory.SharedMemory, shape, dtype=np.uint8) -> np.ndarray:
+    """
+    Returns a numpy view of a frame stored in a shared memory slot, without copying it.
+    """
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def open_source(source):
+    """
+    Opens a frame source. None or a camera index opens the webcam, anything else is passed to
+    cv2.VideoCapture.
+    """
+    if source is None or isinstance(source, int):
+        webcam = Webcam(threaded=True, source=source or 0)
+        return webcam if webcam.open() else None
+    cap = cv2.VideoCapture(source)
+    return cap if cap.isOpened() else None
+
+
+def read_source(capture) -> Optional[np.ndarray]:
+    if isinstance(capture, Webcam):
+        return capture.get_frame()
+    ok, frame = capture.read()
+    return frame if ok else None
+
+
+def close_source(capture) -> None:
+    if isinstance(capture, Webcam):
+        capture.close()
+    elif capture is not None:
+        capture.release()
+
+
+def probe_frame_bytes(source) -> int:
+    """
+    Reads one frame from a source and returns its size in bytes, so the frame slots can be sized
+    for the camera or video before the stages start.
+    """
+    capture = open_source(source)
+    try:
+        frame = read_source(capture) if capture is not None else None
+    finally:
+        close_source(capture)
+    if frame is None:
+        raise ValueError('Could not read a frame from the source!')
+    return frame.nbytes
+
+
+def capture_stage(source, slot_names, free_slots, detect_queue, stop, workers) -> None:
+    """
+    Reads frames from the source into free shared memory slots and queues them for detection.
+
+    A frame is only read once a slot is free, so the number of frames in flight is bounded by
+    the number of slots.
+    """
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    capture = open_source(source)
+    sequence = 0
+    try:
+        while capture is not None and not stop.is_set():
+            try:
+                slot = free_slots.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            frame = read_source(capture)
+            if frame is None:
+                free_slots.put(slot)
+                break
+            if frame.nbytes > slots[slot].size:
+                raise ValueError('Frame does not fit in the shared memory slot!')
+            frame_view(slots[slot], frame.shape)[:] = frame
+            detect_queue.put((sequence, slot, frame.shape, time.monotonic()))
+            sequence += 1
+    finally:
+        close_source(capture)
+        for _ in range(workers):
+            detect_queue.put(None)
+        for shm in slots:
+            shm.close()
+
+
+def detect_stage(slot_names, detect_queue, render_queue, connect4_args) -> None:
+    """
+    Runs Connect4.from_image on queued frames and sends the results on for rendering.
+    """
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    connect4 = Connect4(**connect4_args)
+    try:
+        while True:
+            item = detect_queue.get()
+            if item is None:
+                break
+            sequence, slot, shape, captured = item
+            frame = frame_view(slots[slot], shape)
+            result = {'board': None, 'circles': None, 'piece_colors': None, 'error': None}
+            start = time.monotonic()
+            try:
+                connect4.from_image(frame)
+                result['board'] = connect4.board.tolist()
+                result['circles'] = [tuple(float(v) for v in circle) for circle in connect4.circles]
+                result['piece_colors'] = connect4.piece_colors
+            except ValueError as e:
+                result['error'] = str(e)
+            except Exception as e:
+                # Any other failure still sends a result, as the render stage waits for every
+                # sequence number, and the detector starts afresh on the next frame
+                result.update(board=None, circles=None, piece_colors=None, error='%s: %s' % (type(e).__name__, e))
+                connect4.reset()
+            result['detect_time'] = time.monotonic() - start
+            result['captured'] = captured
+            render_queue.put((sequence, slot, shape, result))
+    finally:
+        render_queue.put(None)
+        for shm in slots:
+            shm.close()
+
+
+def render_stage(slot_names, render_queue, free_slots, results_queue, stop, workers, display) -> None:
+    """
+    Renders detection results in capture order and returns their slots to the capture stage.
+
+    Results can arrive out of order when there are several detection workers, so they are held
+    until every earlier frame has been rendered.
+    """
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    connect4 = Connect4()
+    pending = {}
+    next_sequence = 0
+    finished = 0
+    debug_display = DebugDisplay()
+    try:
+        while finished < workers:
+            item = render_queue.get()
+            if item is None:
+                finished += 1
+                continue
+            pending[item[0]] = item[1:]
+            while next_sequence in pending:
+                slot, shape, result = pending.pop(next_sequence)
+                frame = frame_view(slots[slot], shape)
+                if display:
+                    detected = None
+                    if result['error'] is None:
+                        connect4.img = frame
+                        connect4.circles = result['circles']
+                        connect4.piece_colors = result['piece_colors']
+                        detected = connect4
+                    cv2.imshow('frame', debug_display.render(frame, detected))
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        stop.set()
+                free_slots.put(slot)
+                result['sequence'] = next_sequence
+                result['latency'] = time.monotonic() - result['captured']
+                if results_queue is not None:
+                    try:
+                        results_queue.put_nowait(result)
+                    except queue.Full:
+                        pass
+                next_sequence += 1
+    finally:
+        if display:
+            cv2.destroyAllWindows()
+        if results_queue is not None:
+            results_queue.put(None)
+        for shm in slots:
+            shm.close()
+
+
+class Pipeline:
+    """
+    Runs capture, detection and rendering as separate processes connected by bounded queues.
+
+    Frames are passed between the processes through a fixed pool of shared memory slots rather
+    than being pickled. The capture stage only reads a new frame when a slot is free, so a slow
+    detection stage applies backpressure instead of building up a backlog.
+
+    Attributes
+    ----------
+    source : int, str or None
+        The frame source, None for the webcam or a path or device passed to cv2.VideoCapture.
+    workers : int
+        The number of detection processes.
+    slots : int
+        The number of shared memory frame slots, which bounds the frames in flight.
+    max_frame_bytes : int
+        The size of each slot in bytes, or None to size the slots for the first frame of the
+        source when the pipeline starts.
+    display : bool
+        True if the render stage shows the 2x2 debug display.
+    results : multiprocessing.Queue
+        The ordered detection results, one dict per frame followed by None when the pipeline stops.
+
+    Methods
+    -------
+    start()
+        Allocates the frame slots and starts the processes.
+    stop()
+        Asks the processes to stop.
+    join()
+        Waits for the processes to finish and frees the frame slots.
+    run()
+        Starts the pipeline and waits until it stops.
+    """
+
+    def __init__(self, source=None, workers: int = 2, slots: int = 4,
+                 max_frame_bytes: Optional[int] = None, display: bool = True,
+                 connect4_args: Optional[dict] = None, results_size: int = 64) -> None:
+        """
+        Initializes the pipeline.
+
+        Parameters
+        ----------
+        source : int, str or None, optional
+            The frame source. None opens the webcam. Default is None.
+        workers : int, optional
+            The number of detection processes. Default is 2.
+        slots : int, optional
+            The number of shared memory frame slots. Default is 4.
+        max_frame_bytes : int, optional
+            The size of each slot in bytes. Default is the size of the first frame of the source,
+            read when the pipeline starts.
+        display : bool, optional
+            If True, the render stage shows the 2x2 debug display. Default is True.
+        connect4_args : dict, optional
+            Keyword arguments for the Connect4 object of each detection process.
+        results_size : int, optional
+            The size of the results queue. Results are dropped when it is full. Default is 64.
+        """
+        self.source = source
+        self.workers = workers
+        self.slots = max(slots, workers + 1)
+        self.max_frame_bytes = max_frame_bytes
+        self.display = display
+        self.connect4_args = connect4_args if connect4_args is not None else {'tracking': True}
+        self.results = mp.Queue(results_size)
+        self.stop_event = mp.Event()
+        self.shared: List[shared_memory.SharedMemory] = []
+        self.processes: List[mp.Process] = []
+
+    def start(self) -> None:
+        """
+        Allocates the frame slots and starts the processes. Raises ValueError if the slots are to
+        be sized for the source and no frame can be read from it.
+        """
+        if self.max_frame_bytes is None:
+            # A camera or video larger than expected would otherwise stop the pipeline on its
+            # first frame
+            self.max_frame_bytes = probe_frame_bytes(self.source)
+        self.shared = [shared_memory.SharedMemory(create=True, size=self.max_frame_bytes)
+                       for _ in range(self.slots)]
+        names = [shm.name for shm in self.shared]
+        free_slots = mp.Queue()
+        for slot in range(self.slots):
+            free_slots.put(slot)
+        detect_queue = mp.Queue(self.slots)
+        render_queue = mp.Queue(self.slots + self.workers)
+
+        self.processes = [mp.Process(target=capture_stage, daemon=True,
+                                     args=(self.source, names, free_slots, detect_queue,
+                                           self.stop_event, self.workers))]
+        self.processes += [mp.Process(target=detect_stage, daemon=True,
+                                      args=(names, detect_queue, render_queue, self.connect4_args))
+                           for _ in range(self.workers)]
+        self.processes.append(mp.Process(target=render_stage, daemon=True,
+                                         args=(names, render_queue, free_slots, self.results,
+                                               self.stop_event, self.workers, self.display)))
+        for process in self.processes:
+            process.start()
+
+    def stop(self) -> None:
+        """
+        Asks the processes to stop. Frames already in flight are still delivered.
+        """
+        self.stop_event.set()
+
+    def join(self) -> None:
+        """
+        Waits for the processes to finish and frees the frame slots.
+        """
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        for shm in self.shared:
+            shm.close()
+            shm.unlink()
+        self.shared = []
+
+    def run(self) -> None:
+        """
+        Starts the pipeline and waits until it stops.
+        """
+        self.start()
+        try:
+            # Drain the results so the render stage never waits on a full queue.
+            while self.results.get() is not None:
+                pass
+        except KeyboardInterrupt:
+            self.stop()
+        finally:
+            self.join()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Detect a Connect 4 board with capture, detection and '
+                                                 'rendering in separate processes.')
+    parser.add_argument('source', nargs='?', default='0', help='a camera index, video file or stream URL')
+    parser.add_argument('-w', '--workers', type=int, default=2, help='the number of detection processes')
+    parser.add_argument('--slots', type=int, default=4, help='the number of shared memory frame slots')
+    parser.add_argument('--no-display', action='store_true', help='write each new board as a JSON line instead of '
+                                                                  'showing the debug display')
+    parser.add_argument('--piece-radius', type=int, default=33, help='the radius of a hole in pixels')
+    parser.add_argument('--radius-delta', type=int, default=3, help='the allowed radius error in pixels')
+    parser.add_argument('--coarse-limit', type=int, metavar='PIXELS',
+                        help='search frames larger than this many pixels downscaled first, then refine each hole')
+    args = parser.parse_args(argv)
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    connect4_args = {'tracking': True, 'piece_radius': args.piece_radius, 'radius_delta': args.radius_delta,
+                     'coarse_limit': args.coarse_limit}
+    pipeline = Pipeline(source, args.workers, args.slots, display=not args.no_display, connect4_args=connect4_args)
+    try:
+        pipeline.start()
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    last_board = None
+    try:
+        while True:
+            result = pipeline.results.get()
+            if result is None:
+                break
+            if not args.no_display or result['board'] is None or result['board'] == last_board:
+                continue
+            last_board = result['board']
+            print(json.dumps({'frame': result['sequence'], 'board': result['board'],
+                              'latency': result['latency']}), flush=True)
+    except KeyboardInterrupt:
+        pipeline.stop()
+    finally:
+        pipeline.join()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
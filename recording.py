@@ -0,0 +1,418 @@
+import argparse
+import io
+import json
+import mmap
+import struct
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+MAGIC = b'C4RC'
+CHUNK_MAGIC = b'CHNK'
+INDEX_MAGIC = b'C4IX'
+VERSION = 2
+
+RAW = 0
+JPEG = 1
+
+# The file starts with a header, followed by the detector configuration as JSON and the color
+# table it classified with, if any, then by chunks, each holding a chunk header, the frame blobs
+# and the records of its frames. A complete file ends with the index, all the records again in
+# one array, and a footer pointing at it. A file without a footer, from a recorder that did not
+# close, can still be read by walking the chunks.
+HEADER = struct.Struct('<4sHHII')
+CHUNK_HEADER = struct.Struct('<4sIQ')
+FOOTER = struct.Struct('<QI4s')
+
+# The Connect4 settings stored with a recording, so it is replayed with the same detector
+DETECTOR_SETTINGS = ('piece_radius', 'radius_delta', 'tracking', 'drift_threshold', 'incremental', 'coarse_limit')
+LOCATOR_SETTINGS = ('radius', 'spacing', 'move_threshold')
+
+RECORD_DTYPE = np.dtype([
+    ('offset', '<u8'),
+    ('length', '<u4'),
+    ('timestamp', '<f8'),
+    ('detect_time', '<f4'),
+    ('height', '<u2'),
+    ('width', '<u2'),
+    ('encoding', 'u1'),
+    ('detected', 'u1'),
+    ('board', 'S1', (6, 7)),
+    ('circles', '<f4', (42, 3)),
+])
+
+
+def detector_config(connect4) -> Tuple[dict, bytes]:
+    """
+    Returns the settings of a Connect4 object, and its color table saved as bytes or b'' if it
+    has none.
+    """
+    config = {name: getattr(connect4, name) for name in DETECTOR_SETTINGS}
+    config['locator'] = None
+    if connect4.locator is not None:
+        config['locator'] = {name: getattr(connect4.locator, name) for name in LOCATOR_SETTINGS}
+    table = b''
+    if connect4.color_table is not None:
+        buffer = io.BytesIO()
+        connect4.color_table.save(buffer)
+        table = buffer.getvalue()
+    return config, table
+
+
+class Recorder:
+    """
+    Writes camera frames and their detections to a recording file.
+
+    Frames are buffered in memory and written a chunk at a time. Each frame is stored as a blob,
+    raw or JPEG compressed, with a fixed width record of its board, hole circles and timings, so
+    the replay side can find any frame from the index without decoding the others.
+
+    Attributes
+    ----------
+    path : str
+        The recording file.
+    config : dict
+        The settings of the detector the frames were detected with.
+    jpeg_quality : int
+        The JPEG quality frames are compressed with, or None to store raw pixels.
+    chunk_size : int
+        The number of frames buffered before they are written.
+    count : int
+        The number of frames written so far.
+
+    Methods
+    -------
+    write(frame, connect4=None, detected=None, timestamp=None, detect_time=0.0)
+        Adds a frame and its detection to the recording.
+    flush()
+        Writes the buffered frames as a chunk.
+    close()
+        Writes the buffered frames and the index, and closes the file.
+    """
+
+    def __init__(self, path: str, connect4=None, jpeg_quality: Optional[int] = 90, chunk_size: int = 64) -> None:
+        """
+        Creates a recording file.
+
+        Parameters
+        ----------
+        path : str
+            The recording file to create.
+        connect4 : Connect4, optional
+            The detector the frames are detected with, whose settings and color table are stored
+            so the recording can be replayed with the same detector.
+        jpeg_quality : int, optional
+            The JPEG quality from 0 to 100 frames are compressed with, or None to store raw
+            pixels. Default is 90.
+        chunk_size : int, optional
+            The number of frames buffered before they are written. Default is 64.
+        """
+        self.path = path
+        self.jpeg_quality = jpeg_quality
+        self.chunk_size = chunk_size
+        self.config, table = detector_config(connect4) if connect4 is not None else ({}, b'')
+        config = json.dumps(self.config).encode()
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, len(config), len(table)))
+        self.file.write(config)
+        self.file.write(table)
+        self.blobs: List[bytes] = []
+        self.records = np.zeros(chunk_size, dtype=RECORD_DTYPE)
+        self.index: List[np.ndarray] = []
+        self.count = 0
+
+    def __enter__(self) -> 'Recorder':
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.close()
+        return False
+
+    def write(self, frame: np.ndarray, connect4=None, detected: Optional[bool] = None,
+              timestamp: Optional[float] = None, detect_time: float = 0.0) -> None:
+        """
+        Adds a frame and its detection to the recording.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray
+            The BGR camera frame.
+        connect4 : Connect4, optional
+            The detector whose board and circles were detected in the frame.
+        detected : bool, optional
+            False if detection failed on the frame, so the detector holds an older result.
+            Default is True if connect4 is given.
+        timestamp : float, optional
+            The capture time of the frame. Default is now.
+        detect_time : float, optional
+            The time detection took in seconds. Default is 0.
+        """
+        if self.jpeg_quality is None:
+            blob, encoding = np.ascontiguousarray(frame).tobytes(), RAW
+        else:
+            ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not ok:
+                raise ValueError('Could not encode frame!')
+            blob, encoding = encoded.tobytes(), JPEG
+
+        record = self.records[len(self.blobs)]
+        record['length'] = len(blob)
+        record['timestamp'] = time.time() if timestamp is None else timestamp
+        record['detect_time'] = detect_time
+        record['height'], record['width'] = frame.shape[:2]
+        record['encoding'] = encoding
+        record['board'] = b'O'
+        record['circles'] = 0
+        record['detected'] = connect4 is not None if detected is None else detected
+        if record['detected'] and connect4 is not None:
+            record['board'] = np.asarray(connect4.board).astype('S1')
+            # Circles in the coordinates of the stored frame, not of the board a locator warped it to
+            record['circles'] = np.asarray(connect4.frame_circles(), dtype=np.float32).reshape(42, 3)
+        self.blobs.append(blob)
+        self.count += 1
+        if len(self.blobs) == self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.blobs:
+            return
+        count = len(self.blobs)
+        records = self.records[:count].copy()
+        data_size = sum(len(blob) for blob in self.blobs)
+        start = self.file.tell() + CHUNK_HEADER.size
+        records['offset'] = start + np.concatenate([[0], np.cumsum(records['length'][:-1])])
+        self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, count, data_size))
+        for blob in self.blobs:
+            self.file.write(blob)
+        self.file.write(records.tobytes())
+        self.file.flush()
+        self.index.append(records)
+        self.blobs = []
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+        self.flush()
+        index_offset = self.file.tell()
+        for records in self.index:
+            self.file.write(records.tobytes())
+        self.file.write(FOOTER.pack(index_offset, self.count, INDEX_MAGIC))
+        self.file.close()
+
+
+class Recording:
+    """
+    Reads a recording file through a memory map, with random access by frame index.
+
+    The index of fixed width records is viewed straight from the memory map, and a frame is only
+    decoded when it is asked for, so opening a recording and seeking in it cost nothing however
+    long it is. Raw frames are returned as read-only views of the map.
+
+    Attributes
+    ----------
+    path : str
+        The recording file.
+    records : numpy.ndarray
+        The record of every frame, with the RECORD_DTYPE fields.
+    config : dict
+        The settings of the detector the frames were detected with, empty if not recorded.
+    complete : bool
+        False if the recorder did not close the file and the index was rebuilt from the chunks.
+
+    Methods
+    -------
+    detector(**overrides)
+        Returns a detector with the recorded settings and color table.
+    frame(index)
+        Returns a frame.
+    board(index)
+        Returns the board recorded for a frame, or None if detection failed on it.
+    circles(index)
+        Returns the circles recorded for a frame, or None if detection failed on it.
+    frames(start=0, stop=None)
+        Yields the index and image of each frame in a range.
+    replay(connect4, start=0, stop=None)
+        Runs a detector on each frame in a range and compares its boards with the recorded ones.
+    close()
+        Unmaps the recording file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, config_size, table_size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError('Not a recording: %s' % path)
+        self.config = json.loads(self.map[HEADER.size:HEADER.size + config_size].decode() or '{}')
+        self.table_offset = HEADER.size + config_size
+        self.data_offset = self.table_offset + table_size
+
+        self.complete = False
+        if len(self.map) >= HEADER.size + FOOTER.size:
+            index_offset, count, index_magic = FOOTER.unpack_from(self.map, len(self.map) - FOOTER.size)
+            if index_magic == INDEX_MAGIC:
+                self.records = np.frombuffer(self.map, RECORD_DTYPE, count, index_offset)
+                self.complete = True
+        if not self.complete:
+            self.records = self.scan_chunks()
+
+    def scan_chunks(self) -> np.ndarray:
+        """
+        Rebuilds the index from the chunks, for a file whose recorder did not close it.
+        """
+        records = []
+        offset = self.data_offset
+        while offset + CHUNK_HEADER.size <= len(self.map):
+            magic, count, data_size = CHUNK_HEADER.unpack_from(self.map, offset)
+            end = offset + CHUNK_HEADER.size + data_size + count * RECORD_DTYPE.itemsize
+            if magic != CHUNK_MAGIC or end > len(self.map):
+                break
+            records.append(np.frombuffer(self.map, RECORD_DTYPE, count, offset + CHUNK_HEADER.size + data_size))
+            offset = end
+        if not records:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        return np.concatenate(records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __enter__(self) -> 'Recording':
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.close()
+        return False
+
+    def close(self) -> None:
+        self.records = None
+        try:
+            self.map.close()
+        except BufferError:
+            # Raw frames still in use are views of the map, which is then unmapped once they are gone
+            pass
+
+    def detector(self, **overrides):
+        """
+        Returns a Connect4 object with the settings and color table of the detector the frames
+        were recorded with, where keyword arguments override recorded settings. locate=True or
+        False and colors=None override the locator and the color table.
+        """
+        # Imported here so reading a recording does not need the detector
+        from colortable import ColorTable
+        from connect4 import Connect4
+        from locator import BoardLocator
+
+        settings = {name: self.config[name] for name in DETECTOR_SETTINGS if name in self.config}
+        locator = self.config.get('locator')
+        locate = overrides.pop('locate', locator is not None)
+        if locate:
+            settings['locator'] = BoardLocator(**(locator or {}))
+        if 'colors' in overrides:
+            colors = overrides.pop('colors')
+            if colors is not None:
+                settings['color_table'] = ColorTable.load(colors)
+        elif self.data_offset > self.table_offset:
+            table = self.map[self.table_offset:self.data_offset]
+            settings['color_table'] = ColorTable.load(io.BytesIO(table))
+        settings.update(overrides)
+        return Connect4(**settings)
+
+    def frame(self, index: int) -> np.ndarray:
+        record = self.records[index]
+        blob = np.frombuffer(self.map, np.uint8, int(record['length']), int(record['offset']))
+        if record['encoding'] == JPEG:
+            return cv2.imdecode(blob, cv2.IMREAD_COLOR)
+        return blob.reshape(int(record['height']), int(record['width']), 3)
+
+    def board(self, index: int) -> Optional[np.ndarray]:
+        record = self.records[index]
+        if not record['detected']:
+            return None
+        return record['board'].astype('U1')
+
+    def circles(self, index: int) -> Optional[np.ndarray]:
+        record = self.records[index]
+        if not record['detected']:
+            return None
+        return record['circles'].copy()
+
+    def frames(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        stop = len(self) if stop is None else min(stop, len(self))
+        for index in range(start, stop):
+            yield index, self.frame(index)
+
+    def replay(self, connect4, start: int = 0, stop: Optional[int] = None) -> Iterator[dict]:
+        """
+        Runs a detector on each frame in a range, as fast as it can, and compares its boards with
+        the recorded ones.
+
+        Parameters
+        ----------
+        connect4 : Connect4
+            The detector to run.
+        start : int, optional
+            The first frame. Default is 0.
+        stop : int, optional
+            The frame after the last one. Default is the end of the recording.
+
+        Yields
+        ------
+        dict
+            The frame index, the recorded and replayed boards, None where detection failed, and
+            whether they match.
+        """
+        for index, frame in self.frames(start, stop):
+            try:
+                connect4.from_image(frame)
+                board = connect4.board.copy()
+            except ValueError:
+                board = None
+            recorded = self.board(index)
+            match = (board is None and recorded is None) or (
+                board is not None and recorded is not None and np.array_equal(board, recorded))
+            yield {'index': index, 'recorded': recorded, 'board': board, 'match': match}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Replay a recording through the detector and compare the boards.')
+    parser.add_argument('path', help='the recording file')
+    parser.add_argument('--start', type=int, default=0, help='the first frame to replay')
+    parser.add_argument('--stop', type=int, default=None, help='the frame after the last one to replay')
+    # The detector is rebuilt from the settings stored in the recording, and these only override them
+    parser.add_argument('--piece-radius', type=int, help='the radius of a hole in pixels')
+    parser.add_argument('--radius-delta', type=int, help='the allowed radius error in pixels')
+    parser.add_argument('--coarse-limit', type=int, metavar='PIXELS',
+                        help='search frames larger than this many pixels downscaled first, then refine each hole')
+    parser.add_argument('--tracking', action=argparse.BooleanOptionalAction,
+                        help='replay with the grid locked between frames')
+    parser.add_argument('--locate', action=argparse.BooleanOptionalAction,
+                        help='find the board and correct its perspective automatically')
+    parser.add_argument('--colors', metavar='PATH', help='the color table to classify discs with')
+    args = parser.parse_args(argv)
+
+    overrides = {name: getattr(args, name) for name in ('piece_radius', 'radius_delta', 'coarse_limit', 'tracking', 'locate')
+                 if getattr(args, name) is not None}
+    if args.colors is not None:
+        overrides['colors'] = args.colors
+    with Recording(args.path) as recording:
+        connect4 = recording.detector(**overrides)
+        frames = mismatches = 0
+        start = time.perf_counter()
+        for result in recording.replay(connect4, args.start, args.stop):
+            frames += 1
+            if not result['match']:
+                mismatches += 1
+                print('frame %d differs' % result['index'], file=sys.stderr)
+        elapsed = time.perf_counter() - start
+    print('%d frames in %.2f s, %.0f frames per second, %d differ from the recording'
+          % (frames, elapsed, frames / max(elapsed, 1e-9), mismatches))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -21,7 +21,7 @@ class Scaler:
 
     Methods:
     --------
-    __init__(self, image: np.ndarray, scale_limit: int = 1000) -> None
+    __init__(self, image: np.ndarray, scale_limit: int = 1000, copy: bool = True) -> None
         Initializes the Scaler object with an image and a scale limit.
 
     scale_image(self) -> None
@@ -47,7 +47,7 @@ class Scaler:
     scale_limit: int = 1000
     scale_percent: float = 1
 
-    def __init__(self, image: np.ndarray, scale_limit: int = 1000) -> None:
+    def __init__(self, image: np.ndarray, scale_limit: int = 1000, copy: bool = True) -> None:
         """
         Initializes the Scaler object with an image and a scale limit.
 
@@ -58,8 +58,11 @@ class Scaler:
         scale_limit : int, optional
             The maximum size of the image after scaling. If the image is already smaller than this size,
             it will not be scaled. Default is 1000.
+        copy : bool, optional
+            If False, the image is kept by reference instead of being copied, which is safe as long
+            as the caller does not change it. Default is True.
         """
-        self.img = image.copy()
+        self.img = image.copy() if copy else image
         self.scale_limit = scale_limit
         if self.img.shape[0] > self.scale_limit or self.img.shape[1] > self.scale_limit:
             if self.img.shape[0] > self.img.shape[1]:
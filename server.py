@@ -0,0 +1,300 @@
+import asyncio
+import json
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+EMPTY_BOARD = [['O'] * 7 for _ in range(6)]
+
+
+def board_changes(old: List[List[str]], new: List[List[str]]) -> List[Tuple[int, int, str]]:
+    """
+    Returns the (row, col, value) of every cell that differs between two boards.
+    """
+    return [(row, col, new[row][col]) for row in range(len(new)) for col in range(len(new[row]))
+            if old[row][col] != new[row][col]]
+
+
+def sse_message(event: str, data: dict) -> bytes:
+    return ('event: %s\ndata: %s\n\n' % (event, json.dumps(data))).encode()
+
+
+class BoardServer:
+    """
+    Publishes the detected board and the stage timings to many clients over HTTP.
+
+    The server runs an asyncio event loop on its own thread. The detection loop hands it each
+    board with publish(), which only schedules the board on the event loop, so publishing never
+    waits on the network.
+
+    Clients subscribe with `GET /events`, a server-sent events stream that starts with a
+    `snapshot` event holding the whole board and then sends a `delta` event with only the changed
+    cells whenever the board changes, and a `health` event with the stage timings. `GET /board`
+    and `GET /health` return the latest board and timings as JSON.
+
+    Every client has its own bounded queue of events. A client that falls queue_size events
+    behind, because it reads slower than the board changes, is disconnected rather than
+    buffered without limit or allowed to hold up the other clients.
+
+    Attributes
+    ----------
+    host : str
+        The address the server listens on.
+    port : int
+        The port the server listens on, the one picked by the system if 0 was given.
+    queue_size : int
+        The number of events a client may fall behind before it is disconnected.
+    health_interval : float
+        The minimum time between health events in seconds.
+    clients : int
+        The number of connected clients.
+    dropped : int
+        The number of clients disconnected for falling behind.
+
+    Methods
+    -------
+    start()
+        Starts the server on a background thread and waits until it is listening, raising the
+        error if it cannot listen.
+    stop()
+        Disconnects every client and stops the server.
+    publish(board, frame_index=None, winner=None)
+        Sends a board to the clients if it changed.
+    publish_connect4(connect4)
+        Sends the board of a Connect4 object to the clients if it changed.
+    publish_health(timer)
+        Sends the stage timings of a StageTimer, at most once every health_interval.
+    serve()
+        Runs the server on the current event loop until stop() is called.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, queue_size: int = 32,
+                 health_interval: float = 1.0) -> None:
+        """
+        Initializes the server.
+
+        Parameters
+        ----------
+        host : str, optional
+            The address to listen on. Default is '127.0.0.1', use '0.0.0.0' for the whole LAN.
+        port : int, optional
+            The port to listen on, 0 for any free port. Default is 8765.
+        queue_size : int, optional
+            The number of events a client may fall behind before it is disconnected. Default is 32.
+        health_interval : float, optional
+            The minimum time between health events in seconds. Default is 1.0.
+        """
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.health_interval = health_interval
+        self.board = EMPTY_BOARD
+        self.frame_index = None
+        self.winner = None
+        self.health = {}
+        self.queues: Dict[asyncio.Queue, asyncio.StreamWriter] = {}
+        self.streams = set()
+        self.dropped = 0
+        self.loop = None
+        self.thread = None
+        self.stopping = None
+        self.ready = threading.Event()
+        self.error = None
+        self.last_health = 0.0
+
+    @property
+    def clients(self) -> int:
+        return len(self.queues)
+
+    def start(self) -> 'BoardServer':
+        if self.thread is None:
+            self.ready.clear()
+            self.error = None
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+            self.ready.wait()
+            if self.error is not None:
+                # The server could not listen, for example because the port is taken
+                self.thread.join()
+                self.thread = None
+                raise self.error
+        return self
+
+    def run(self) -> None:
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            self.error = e
+        finally:
+            self.ready.set()
+
+    def stop(self) -> None:
+        if self.loop is not None and self.stopping is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self) -> 'BoardServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> bool:
+        self.stop()
+        return False
+
+    def publish(self, board, frame_index: Optional[int] = None, winner: Optional[str] = None) -> None:
+        """
+        Sends a board to the clients if it changed. Safe to call from any thread, and never blocks.
+
+        Parameters
+        ----------
+        board : array_like
+            The 6x7 board of 'R', 'Y' and 'O'.
+        frame_index : int, optional
+            The index of the frame the board was detected in.
+        winner : str, optional
+            The winner of the board, 'R' or 'Y', or None.
+        """
+        if self.loop is None:
+            return
+        board = board.tolist() if isinstance(board, np.ndarray) else [list(row) for row in board]
+        self.loop.call_soon_threadsafe(self.update_board, board, frame_index, winner)
+
+    def publish_connect4(self, connect4) -> None:
+        self.publish(connect4.board, connect4.frame_index, connect4.check_winner())
+
+    def publish_health(self, timer) -> None:
+        """
+        Sends the frame rate and stage timings of a StageTimer, at most once every health_interval.
+        """
+        now = time.monotonic()
+        if self.loop is None or now - self.last_health < self.health_interval:
+            return
+        self.last_health = now
+        health = {'time': time.time(), 'fps': timer.fps(), 'stages': timer.summary()}
+        self.loop.call_soon_threadsafe(self.update_health, health)
+
+    def update_board(self, board: List[List[str]], frame_index: Optional[int], winner: Optional[str]) -> None:
+        changes = board_changes(self.board, board)
+        self.frame_index = frame_index
+        if not changes and winner == self.winner:
+            return
+        self.board = board
+        self.winner = winner
+        self.broadcast(sse_message('delta', {'frame': frame_index, 'changes': changes, 'winner': winner}))
+
+    def update_health(self, health: dict) -> None:
+        self.health = health
+        self.broadcast(sse_message('health', health))
+
+    def snapshot(self) -> dict:
+        return {'frame': self.frame_index, 'board': self.board, 'winner': self.winner}
+
+    def broadcast(self, message: bytes) -> None:
+        for queue in list(self.queues):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.disconnect(queue)
+
+    def disconnect(self, queue: asyncio.Queue, dropped: bool = True) -> None:
+        writer = self.queues.pop(queue, None)
+        if writer is None:
+            return
+        self.dropped += dropped
+        # Throw away what the client has not read and wake its sender to stop it. The connection
+        # is aborted, as a sender waiting on a full socket buffer would never see the wake up.
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+        writer.transport.abort()
+
+    async def serve(self) -> None:
+        self.stopping = asyncio.Event()
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        # Publishing only starts once the server is listening, so it never targets a dead loop
+        self.loop = asyncio.get_running_loop()
+        self.ready.set()
+        try:
+            async with server:
+                await self.stopping.wait()
+        finally:
+            for queue in list(self.queues):
+                self.disconnect(queue, dropped=False)
+            if self.streams:
+                await asyncio.gather(*self.streams, return_exceptions=True)
+            self.loop = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        method, path = (request.split(b' ', 2) + [b'', b''])[:2]
+        path = path.decode(errors='replace').split('?')[0]
+        if method != b'GET':
+            await self.respond(writer, '405 Method Not Allowed', {'error': 'Only GET is supported'})
+        elif path == '/board':
+            await self.respond(writer, '200 OK', self.snapshot())
+        elif path == '/health':
+            await self.respond(writer, '200 OK', self.health)
+        elif path == '/events':
+            await self.stream(writer)
+        else:
+            await self.respond(writer, '404 Not Found', {'error': 'Unknown path'})
+
+    async def respond(self, writer: asyncio.StreamWriter, status: str, data: dict) -> None:
+        body = json.dumps(data).encode()
+        writer.write(('HTTP/1.1 %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n'
+                      'Connection: close\r\n\r\n' % (status, len(body))).encode() + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def stream(self, writer: asyncio.StreamWriter) -> None:
+        queue = asyncio.Queue(self.queue_size)
+        queue.put_nowait(sse_message('snapshot', self.snapshot()))
+        self.queues[queue] = writer
+        self.streams.add(asyncio.current_task())
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                     b'Connection: keep-alive\r\n\r\n')
+        try:
+            while queue in self.queues:
+                message = await queue.get()
+                if message is None:
+                    break
+                writer.write(message)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.streams.discard(asyncio.current_task())
+            self.queues.pop(queue, None)
+            writer.close()
+
+
+async def subscribe(host: str = '127.0.0.1', port: int = 8765) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Connects to the events stream of a BoardServer and yields each (event, data) it sends, until
+    the server closes the stream.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(('GET /events HTTP/1.1\r\nHost: %s\r\nAccept: text/event-stream\r\n\r\n' % host).encode())
+    await writer.drain()
+    try:
+        await reader.readuntil(b'\r\n\r\n')
+        while True:
+            try:
+                block = await reader.readuntil(b'\n\n')
+            except asyncio.IncompleteReadError:
+                return
+            fields = dict(line.split(': ', 1) for line in block.decode().strip().split('\n'))
+            yield fields['event'], json.loads(fields['data'])
+    finally:
+        writer.close()
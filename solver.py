@@ -0,0 +1,376 @@
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from bitboard import Bitboard, BOARD_MASK, BOTTOM_MASK, COLUMN_MASKS, COLS, ROWS
+
+# Scores above this are forced wins, the closer to WIN_SCORE the sooner the win.
+WIN_SCORE = 1000
+WIN_THRESHOLD = WIN_SCORE - ROWS * COLS - 1
+
+# Center columns take part in more fours, so they are searched first.
+CENTER_ORDER = (3, 2, 4, 1, 5, 0, 6)
+
+# The clock is read every 256 nodes, about 1.5 ms of search, so a search stops close to its deadline.
+CHECK_MASK = 255
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+class SolveResult(NamedTuple):
+    """
+    The result of analysing a position.
+
+    Attributes
+    ----------
+    column : int or None
+        The best column for the player to move, None if the game is over.
+    score : int
+        The score from the point of view of the player to move. Scores above WIN_THRESHOLD are
+        forced wins, scores below -WIN_THRESHOLD are forced losses.
+    depth : int
+        The depth of the deepest completed search.
+    exact : bool
+        True if the search reached the end of the game, so the score is not a heuristic.
+    """
+    column: Optional[int]
+    score: int
+    depth: int
+    exact: bool
+
+
+class _Timeout(Exception):
+    pass
+
+
+class TranspositionTable:
+    """
+    A fixed size transposition table.
+
+    Entries are stored in a preallocated list indexed by key modulo the table size. When two
+    positions share a slot the entry from the deeper search is kept, unless the stored entry is
+    from an older search generation, in which case it is always replaced.
+
+    Attributes
+    ----------
+    size : int
+        The number of slots in the table.
+    generation : int
+        The current search generation, bumped by new_search().
+
+    Methods
+    -------
+    get(key)
+        Returns the (depth, flag, score, column) entry for a key, or None.
+    put(key, depth, flag, score, column)
+        Stores an entry, subject to the replacement policy.
+    new_search()
+        Marks all existing entries as stale so they can be replaced freely.
+    clear()
+        Removes all entries.
+    """
+
+    def __init__(self, size: int = 1000003) -> None:
+        """
+        Initializes the table.
+
+        Parameters
+        ----------
+        size : int, optional
+            The number of slots in the table. A prime keeps the keys spread out. Default is 1000003.
+        """
+        self.size = size
+        self.generation = 0
+        self.slots = [None] * size
+
+    def get(self, key: int):
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key:
+            return entry[1:5]
+        return None
+
+    def put(self, key: int, depth: int, flag: int, score: int, column: int) -> None:
+        index = key % self.size
+        entry = self.slots[index]
+        if entry is None or entry[0] == key or entry[5] != self.generation or depth >= entry[1]:
+            self.slots[index] = (key, depth, flag, score, column, self.generation)
+
+    def new_search(self) -> None:
+        self.generation += 1
+
+    def clear(self) -> None:
+        self.slots = [None] * self.size
+        self.generation = 0
+
+
+def winning_cells(position: int, mask: int) -> int:
+    """
+    Returns the empty cells that would complete a four for the player owning position.
+
+    Parameters
+    ----------
+    position : int
+        The bit mask of the player's pieces.
+    mask : int
+        The bit mask of all pieces on the board.
+
+    Returns
+    -------
+    int
+        A bit mask of the empty cells, playable or not, that would win for the player.
+    """
+    # Vertical
+    cells = (position << 1) & (position << 2) & (position << 3)
+    # Horizontal and the two diagonals
+    for shift in (ROWS + 1, ROWS, ROWS + 2):
+        pair = (position << shift) & (position << 2 * shift)
+        cells |= pair & (position << 3 * shift)
+        cells |= pair & (position >> shift)
+        pair = (position >> shift) & (position >> 2 * shift)
+        cells |= pair & (position << shift)
+        cells |= pair & (position >> 3 * shift)
+    return cells & (BOARD_MASK ^ mask)
+
+
+class Solver:
+    """
+    A negamax solver with alpha-beta pruning that suggests the best move for a board.
+
+    The search uses iterative deepening within a time and depth budget, so it can answer within
+    one frame of the main loop, and returns the result of the deepest completed search. Positions
+    that could not be searched to the end are scored by counting the cells that would complete
+    a four for each player.
+
+    The transposition table and the results of previous calls are kept between calls, so
+    analysing the same position on consecutive frames returns the cached result immediately.
+    Positions found in an opening book, if one is given, are answered from the book without
+    searching.
+
+    Attributes
+    ----------
+    time_budget : float
+        The maximum time to spend on a search in seconds.
+    max_depth : int
+        The maximum search depth in plies.
+    table : TranspositionTable
+        The transposition table shared by all searches.
+    nodes : int
+        The number of positions visited by the last search.
+    book : OpeningBook
+        The opening book consulted before searching, or None.
+
+    Methods
+    -------
+    solve(board, first='R', refine=False)
+        Returns the best move and score for a Connect4.board array.
+    solve_bitboard(bitboard, refine=False)
+        Returns the best move and score for a Bitboard.
+    clear()
+        Clears the transposition table and the result cache.
+    """
+
+    def __init__(self, time_budget: float = 0.03, max_depth: int = ROWS * COLS,
+                 table_size: int = 1000003, cache_size: int = 1024, book=None) -> None:
+        """
+        Initializes the solver.
+
+        Parameters
+        ----------
+        time_budget : float, optional
+            The maximum time to spend on a search in seconds. Default is 0.03, about one frame
+            at 30 frames per second.
+        max_depth : int, optional
+            The maximum search depth in plies. Default is 42, the whole game.
+        table_size : int, optional
+            The number of slots in the transposition table. Default is 1000003.
+        cache_size : int, optional
+            The number of results to keep between calls. Default is 1024.
+        book : OpeningBook, optional
+            An opening book consulted before searching. Default is None.
+        """
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.table = TranspositionTable(table_size)
+        self.cache_size = cache_size
+        self.results = OrderedDict()
+        self.nodes = 0
+        self.deadline = 0.0
+        self.book = book
+
+    def solve(self, board: np.ndarray, first: str = 'R', refine: bool = False) -> SolveResult:
+        """
+        Returns the best move and score for a Connect4.board array.
+
+        Parameters
+        ----------
+        board : numpy.ndarray
+            A 6x7 array of 'R', 'Y' and 'O' with row 0 at the top of the board.
+        first : str, optional
+            The player that moved first, 'R' or 'Y'. Default is 'R'.
+        refine : bool, optional
+            If True, a cached result that is not exact is searched again to try to go deeper.
+            Default is False.
+
+        Returns
+        -------
+        SolveResult
+            The best column and score for the player to move.
+        """
+        return self.solve_bitboard(Bitboard.from_board(board, first), refine)
+
+    def solve_bitboard(self, bitboard: Bitboard, refine: bool = False) -> SolveResult:
+        """
+        Returns the best move and score for a Bitboard.
+
+        Parameters
+        ----------
+        bitboard : Bitboard
+            The position to analyse.
+        refine : bool, optional
+            If True, a cached result that is not exact is searched again to try to go deeper.
+            Default is False.
+
+        Returns
+        -------
+        SolveResult
+            The best column and score for the player to move.
+        """
+        if self.book is not None:
+            result = self.book.lookup_bitboard(bitboard)
+            if result is not None:
+                return result
+
+        key = bitboard.key()
+        cached = self.results.get(key)
+        if cached is not None and (cached.exact or not refine or cached.depth >= self.max_depth):
+            self.results.move_to_end(key)
+            return cached
+
+        result = self._search(bitboard)
+        self.results[key] = result
+        if len(self.results) > self.cache_size:
+            self.results.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        """
+        Clears the transposition table and the result cache.
+        """
+        self.table.clear()
+        self.results.clear()
+
+    def _search(self, bitboard: Bitboard) -> SolveResult:
+        player = bitboard.current_player()
+        position = bitboard.masks[player]
+        mask = bitboard.masks[0] | bitboard.masks[1]
+        moves = bitboard.count
+
+        # The game is already over, there is nothing to suggest.
+        opponent = bitboard.masks[1 - player]
+        if Bitboard.is_win(opponent):
+            return SolveResult(None, -(WIN_SCORE - moves), 0, True)
+        if Bitboard.is_win(position):
+            return SolveResult(None, WIN_SCORE - moves, 0, True)
+        playable = [col for col in CENTER_ORDER if bitboard.can_play(col)]
+        if not playable:
+            return SolveResult(None, 0, 0, True)
+
+        self.table.new_search()
+        self.nodes = 0
+        self.deadline = time.perf_counter() + self.time_budget
+        remaining = ROWS * COLS - moves
+        best = SolveResult(playable[0], 0, 0, False)
+        for depth in range(1, min(self.max_depth, remaining) + 1):
+            # Each depth takes at least as long as the last, so one that cannot finish before the
+            # deadline is not started
+            start = time.perf_counter()
+            if depth > 1 and start + elapsed > self.deadline:
+                break
+            try:
+                column, score = self._search_root(position, mask, moves, depth, playable, best.column)
+            except _Timeout:
+                break
+            elapsed = time.perf_counter() - start
+            exact = depth >= remaining or abs(score) > WIN_THRESHOLD
+            best = SolveResult(column, score, depth, exact)
+            if exact:
+                break
+        return best
+
+    def _search_root(self, position, mask, moves, depth, playable, previous):
+        order = [previous] + [col for col in playable if col != previous]
+        alpha = -WIN_SCORE
+        beta = WIN_SCORE
+        best_column = order[0]
+        for col in order:
+            move = (mask + BOTTOM_MASK) & COLUMN_MASKS[col]
+            if Bitboard.is_win(position | move):
+                return col, WIN_SCORE - moves - 1
+            score = -self._negamax(position ^ mask, mask | move, moves + 1, depth - 1, -beta, -alpha)
+            if score > alpha:
+                alpha = score
+                best_column = col
+        return best_column, alpha
+
+    def _negamax(self, position, mask, moves, depth, alpha, beta):
+        self.nodes += 1
+        if not self.nodes & CHECK_MASK and time.perf_counter() > self.deadline:
+            raise _Timeout()
+
+        possible = (mask + BOTTOM_MASK) & BOARD_MASK
+        if not possible:
+            return 0
+        # Take an immediate win if there is one.
+        if winning_cells(position, mask) & possible:
+            return WIN_SCORE - moves - 1
+        if depth == 0:
+            opponent = position ^ mask
+            return (winning_cells(position, mask).bit_count()
+                    - winning_cells(opponent, mask).bit_count())
+
+        key = position + mask + BOTTOM_MASK
+        alpha_start = alpha
+        tt_column = -1
+        entry = self.table.get(key)
+        if entry is not None:
+            tt_depth, flag, score, tt_column = entry
+            if tt_depth >= depth:
+                if flag == EXACT:
+                    return score
+                if flag == LOWER:
+                    alpha = max(alpha, score)
+                elif flag == UPPER:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+
+        best_score = -WIN_SCORE
+        best_column = -1
+        order = CENTER_ORDER if tt_column < 0 else (tt_column,) + CENTER_ORDER
+        for col in order:
+            if col == tt_column and best_column >= 0:
+                continue
+            move = possible & COLUMN_MASKS[col]
+            if not move:
+                continue
+            score = -self._negamax(position ^ mask, mask | move, moves + 1, depth - 1, -beta, -alpha)
+            if score > best_score:
+                best_score = score
+                best_column = col
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= alpha_start:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.put(key, depth, flag, best_score, best_column)
+        return best_score
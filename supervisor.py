@@ -0,0 +1,274 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from colortable import ColorTable, camera_path
+from connect4 import Connect4
+from instrumentation import StageTimer
+from webcam import Webcam
+
+Source = Union[int, str]
+
+
+class _Board:
+    """
+    The capture and detection state of one board inside a worker process.
+    """
+
+    def __init__(self, name: str, source: Source, connect4_args: dict) -> None:
+        self.name = name
+        self.source = source
+        # Cameras are read on a thread so only the newest frame is detected, while video files
+        # are read frame by frame so none are skipped
+        self.webcam = Webcam(threaded=isinstance(source, int), source=source)
+        self.timer = StageTimer(enabled=True)
+        # Each camera classifies disc colors with its own calibrated table when it has one
+        colors = camera_path(source)
+        if os.path.exists(colors) and 'color_table' not in connect4_args:
+            connect4_args = dict(connect4_args, color_table=ColorTable.load(colors))
+        self.connect4 = Connect4(timer=self.timer, **connect4_args)
+        self.frames = 0
+        self.detected = 0
+        self.failures = 0
+        self.changes = 0
+        self.last_board = None
+        self.last_change = None
+
+    def metrics(self) -> dict:
+        return {'frames': self.frames, 'detected': self.detected, 'failures': self.failures,
+                'changes': self.changes, 'last_change': self.last_change, 'fps': self.timer.fps(),
+                'dropped': self.webcam.frames_dropped, 'stages': self.timer.summary()}
+
+
+def board_worker(assignments: List[Tuple[str, Source]], messages, stop, connect4_args: dict,
+                 metrics_interval: float) -> None:
+    """
+    Captures and detects the boards assigned to one worker process, taking one frame from each in
+    turn, and reports board changes and metrics to the supervisor.
+    """
+    boards = []
+    for name, source in assignments:
+        board = _Board(name, source, connect4_args)
+        if board.webcam.open():
+            boards.append(board)
+        else:
+            messages.put(('finished', name, 'Could not open source'))
+
+    next_metrics = time.monotonic() + metrics_interval
+    try:
+        while boards and not stop.is_set():
+            for board in list(boards):
+                with board.timer.stage('capture'):
+                    frame = board.webcam.get_frame()
+                if frame is None:
+                    if board.webcam.threaded and board.webcam.running:
+                        continue
+                    messages.put(('metrics', board.name, board.metrics()))
+                    messages.put(('finished', board.name, 'End of source'))
+                    board.webcam.close()
+                    boards.remove(board)
+                    continue
+
+                board.frames += 1
+                try:
+                    with board.timer.stage('detect'):
+                        board.connect4.from_image(frame)
+                except ValueError:
+                    board.failures += 1
+                else:
+                    board.detected += 1
+                    cells = board.connect4.board.tolist()
+                    if cells != board.last_board:
+                        board.last_board = cells
+                        board.last_change = time.time()
+                        board.changes += 1
+                        messages.put(('board', board.name, {'frame': board.frames - 1, 'board': cells,
+                                                            'winner': board.connect4.check_winner()}))
+                board.timer.tick()
+
+            if time.monotonic() >= next_metrics:
+                next_metrics += metrics_interval
+                for board in boards:
+                    messages.put(('metrics', board.name, board.metrics()))
+    finally:
+        for board in boards:
+            messages.put(('metrics', board.name, board.metrics()))
+            messages.put(('finished', board.name, 'Stopped'))
+            board.webcam.close()
+
+
+class Supervisor:
+    """
+    Runs the detection of several boards, each from its own camera or video file, on a pool of
+    worker processes.
+
+    The boards are spread over the workers, and each worker captures and detects its boards in
+    turn, so throughput scales with the number of cores up to one worker per board. Every board
+    has its own Connect4 object and StageTimer in its worker, so no detection state is shared
+    between boards. Workers send board changes and per board metrics back on a queue, and
+    poll() applies them to the boards attribute.
+
+    Attributes
+    ----------
+    sources : dict
+        The camera index, video file or stream URL of each board, by name.
+    workers : int
+        The number of worker processes.
+    metrics_interval : float
+        The time between metrics reports of each board in seconds.
+    boards : dict
+        The latest board, winner, metrics and finish reason of each board, by name.
+
+    Methods
+    -------
+    start()
+        Starts the worker processes.
+    stop()
+        Asks the workers to stop.
+    join()
+        Waits for the workers to finish.
+    poll(timeout=0.1)
+        Applies the messages sent by the workers and returns them.
+    run(callback=None)
+        Starts the workers and polls until every board has finished.
+    """
+
+    def __init__(self, sources: Union[Dict[str, Source], List[Source]], workers: Optional[int] = None,
+                 connect4_args: Optional[dict] = None, metrics_interval: float = 5.0) -> None:
+        """
+        Initializes the supervisor.
+
+        Parameters
+        ----------
+        sources : dict or list
+            The camera index, video file or stream URL of each board, by name. A list names each
+            board after its source.
+        workers : int, optional
+            The number of worker processes. Default is one per board, up to the number of CPUs.
+        connect4_args : dict, optional
+            Keyword arguments for the Connect4 object of each board. Default is tracking mode.
+        metrics_interval : float, optional
+            The time between metrics reports of each board in seconds. Default is 5.0.
+        """
+        if not isinstance(sources, dict):
+            sources = {str(source): source for source in sources}
+        self.sources = sources
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(sources)))
+        self.connect4_args = connect4_args if connect4_args is not None else {'tracking': True}
+        self.metrics_interval = metrics_interval
+        self.boards = {name: {'board': None, 'winner': None, 'metrics': None, 'finished': None}
+                       for name in sources}
+        self.messages = mp.Queue()
+        self.stop_event = mp.Event()
+        self.processes: List[mp.Process] = []
+
+    def start(self) -> None:
+        names = list(self.sources)
+        for worker in range(self.workers):
+            assignments = [(name, self.sources[name]) for name in names[worker::self.workers]]
+            process = mp.Process(target=board_worker, daemon=True,
+                                 args=(assignments, self.messages, self.stop_event, self.connect4_args,
+                                       self.metrics_interval))
+            process.start()
+            self.processes.append(process)
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def join(self) -> None:
+        # Keep draining messages, as a worker cannot exit while its queue buffer is full
+        while any(process.is_alive() for process in self.processes):
+            self.poll()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.poll(timeout=0)
+
+    def finished(self) -> bool:
+        return all(board['finished'] is not None for board in self.boards.values())
+
+    def poll(self, timeout: float = 0.1) -> List[tuple]:
+        """
+        Applies the messages sent by the workers to the boards attribute and returns them.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The time to wait for the first message in seconds. Default is 0.1.
+
+        Returns
+        -------
+        list of tuple
+            The (kind, name, data) messages, where kind is 'board', 'metrics' or 'finished'.
+        """
+        messages = []
+        try:
+            message = self.messages.get(timeout=timeout) if timeout > 0 else self.messages.get_nowait()
+            while True:
+                messages.append(message)
+                message = self.messages.get_nowait()
+        except queue.Empty:
+            pass
+        for kind, name, data in messages:
+            board = self.boards[name]
+            if kind == 'board':
+                board['board'] = data['board']
+                board['winner'] = data['winner']
+            elif kind == 'metrics':
+                board['metrics'] = data
+            else:
+                board['finished'] = data
+        return messages
+
+    def run(self, callback=None) -> None:
+        """
+        Starts the workers and polls until every board has finished, calling callback with each
+        message.
+        """
+        self.start()
+        try:
+            while not self.finished():
+                for message in self.poll():
+                    if callback is not None:
+                        callback(*message)
+        except KeyboardInterrupt:
+            self.stop()
+        finally:
+            self.stop()
+            self.join()
+
+
+def parse_source(value: str) -> Tuple[str, Source]:
+    """
+    Parses a NAME=SOURCE or SOURCE argument, where a source of digits is a camera index.
+    """
+    name, _, source = value.rpartition('=')
+    source = int(source) if source.isdigit() else source
+    return name or str(source), source
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Detect several Connect 4 boards from cameras or video files.')
+    parser.add_argument('sources', nargs='+', metavar='[NAME=]SOURCE', help='a camera index, video file or stream URL')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='the number of worker processes')
+    parser.add_argument('--interval', type=float, default=5.0, help='the time between metrics reports in seconds')
+    parser.add_argument('--piece-radius', type=int, default=33, help='the radius of a hole in pixels')
+    parser.add_argument('--coarse-limit', type=int, metavar='PIXELS', help='search frames larger than this many pixels downscaled first, then refine each hole')
+    args = parser.parse_args(argv)
+
+    sources = dict(parse_source(value) for value in args.sources)
+    connect4_args = {'tracking': True, 'piece_radius': args.piece_radius, 'coarse_limit': args.coarse_limit}
+    supervisor = Supervisor(sources, args.workers, connect4_args, args.interval)
+
+    def report(kind, name, data):
+        print(json.dumps({'event': kind, 'name': name, 'data': data}), flush=True)
+
+    supervisor.run(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import time
+from typing import Iterator, NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from bitboard import Bitboard, COLS, ROWS
+
+# Colors in BGR, indexed by the cell value of a label map.
+EMPTY_COLOR = (235, 235, 235)
+RED_COLOR = (40, 40, 220)
+YELLOW_COLOR = (40, 220, 240)
+FRAME_COLOR = (110, 20, 0)
+BACKGROUND_COLOR = (200, 200, 200)
+
+FRAME_LABEL = ROWS * COLS
+
+# Lighting gain is computed on a coarse grid and scaled up, since it varies slowly.
+GAIN_GRID = (16, 12)
+
+
+class SyntheticFrame(NamedTuple):
+    """
+    A generated board image with its ground truth.
+
+    Attributes
+    ----------
+    image : numpy.ndarray
+        The BGR image.
+    board : numpy.ndarray
+        The 6x7 board of 'R', 'Y' and 'O' drawn in the image.
+    circles : numpy.ndarray
+        The 42 (x, y, r) holes in the image, in the reading order of Connect4.circles.
+    homography : numpy.ndarray
+        The 3x3 transform from the canonical board to the image.
+    """
+    image: np.ndarray
+    board: np.ndarray
+    circles: np.ndarray
+    homography: np.ndarray
+
+
+def random_board(rng: np.random.Generator, moves: Optional[int] = None) -> np.ndarray:
+    """
+    Returns a board reached by random legal moves, stopping early if someone wins.
+    """
+    bitboard = Bitboard()
+    if moves is None:
+        moves = int(rng.integers(0, ROWS * COLS + 1))
+    for _ in range(moves):
+        legal = bitboard.legal_moves()
+        if not legal or bitboard.winner() is not None:
+            break
+        bitboard.play(int(rng.choice(legal)))
+    return bitboard.to_board()
+
+
+class BoardRenderer:
+    """
+    Draws Connect 4 board images from board states, for load and accuracy testing.
+
+    The board is drawn once as a canonical label map in which every pixel holds the index of its
+    hole or of the frame. A frame is made by coloring the label map with one color map lookup,
+    warping the result into the output with a single perspective transform and then applying
+    lighting, noise and blur. Noise is cropped from a precomputed noise field.
+
+    Attributes
+    ----------
+    width : int
+        The width of the output images.
+    height : int
+        The height of the output images.
+    radius : int
+        The hole radius of the canonical board in pixels.
+    spacing : float
+        The distance between neighbouring hole centers as a multiple of the radius.
+
+    Methods
+    -------
+    render(board, scale=1.0, rotation=0.0, perspective=(0.0, 0.0), brightness=1.0,
+           gradient=0.0, noise=0.0, blur=0, offset=(0.0, 0.0))
+        Draws a board with the given camera and lighting parameters.
+    random_frame(board=None)
+        Draws a random board with random parameters.
+    frames(count)
+        Yields random frames.
+    """
+
+    def __init__(self, width: int = 800, height: int = 600, radius: int = 33,
+                 spacing: float = 2.5, seed: Optional[int] = None) -> None:
+        """
+        Initializes the renderer and draws the canonical board.
+
+        Parameters
+        ----------
+        width : int, optional
+            The width of the output images. Default is 800.
+        height : int, optional
+            The height of the output images. Default is 600.
+        radius : int, optional
+            The hole radius of the canonical board in pixels. Default is 33, the Connect4 default.
+        spacing : float, optional
+            The distance between neighbouring hole centers as a multiple of the radius. Default is 2.5.
+        seed : int, optional
+            The seed of the random generator used for noise and random frames.
+        """
+        self.width = width
+        self.height = height
+        self.radius = radius
+        self.spacing = spacing
+        self.rng = np.random.default_rng(seed)
+
+        # Holes are one step apart with half a step of frame around the outer holes.
+        step = radius * spacing
+        self.board_size = (int(round(COLS * step)), int(round(ROWS * step)))
+        cols, rows = np.meshgrid(np.arange(COLS), np.arange(ROWS))
+        self.centers = np.column_stack([(cols.ravel() + 0.5) * step, (rows.ravel() + 0.5) * step])
+
+        # Every pixel of the canonical board is labelled with its hole, or with the frame.
+        self.labels = np.full(self.board_size[::-1], FRAME_LABEL, dtype=np.uint8)
+        for idx, (x, y) in enumerate(self.centers):
+            cv2.circle(self.labels, (int(round(x)), int(round(y))), radius, idx, -1)
+
+        self.palette = np.array([EMPTY_COLOR, RED_COLOR, YELLOW_COLOR], dtype=np.uint8)
+        self.table = np.zeros((256, 1, 3), dtype=np.uint8)
+        self.table[FRAME_LABEL, 0] = FRAME_COLOR
+
+        # Noise is stored offset by 128 so it can be added with saturating uint8 arithmetic.
+        noise_field = self.rng.normal(128, 32, (height * 2, width * 2, 3))
+        self.noise_field = np.clip(noise_field, 0, 255).astype(np.uint8)
+        ys, xs = np.mgrid[0:GAIN_GRID[1], 0:GAIN_GRID[0]].astype(np.float32)
+        self.ramp_x = xs / (GAIN_GRID[0] - 1) - 0.5
+        self.ramp_y = ys / (GAIN_GRID[1] - 1) - 0.5
+
+    def homography(self, scale: float, rotation: float, perspective, offset) -> np.ndarray:
+        """
+        Returns the transform from the canonical board to the output image.
+        """
+        w, h = self.board_size
+        to_center = np.array([[1, 0, -w / 2], [0, 1, -h / 2], [0, 0, 1]], dtype=float)
+        cos, sin = np.cos(np.radians(rotation)) * scale, np.sin(np.radians(rotation)) * scale
+        rotate = np.array([[cos, -sin, 0], [sin, cos, 0], [0, 0, 1]], dtype=float)
+        tilt = np.array([[1, 0, 0], [0, 1, 0], [perspective[0] / w, perspective[1] / h, 1]], dtype=float)
+        to_output = np.array([[1, 0, self.width / 2 + offset[0]], [0, 1, self.height / 2 + offset[1]], [0, 0, 1]],
+                             dtype=float)
+        return to_output @ tilt @ rotate @ to_center
+
+    def render(self, board: np.ndarray, scale: float = 1.0, rotation: float = 0.0, perspective=(0.0, 0.0),
+               brightness: float = 1.0, gradient: float = 0.0, noise: float = 0.0, blur: int = 0,
+               offset=(0.0, 0.0)) -> SyntheticFrame:
+        """
+        Draws a board with the given camera and lighting parameters.
+
+        Parameters
+        ----------
+        board : numpy.ndarray
+            The 6x7 board of 'R', 'Y' and 'O' to draw.
+        scale : float, optional
+            The size of the board relative to the canonical board. Default is 1.0.
+        rotation : float, optional
+            The rotation of the board in degrees. Default is 0.0.
+        perspective : tuple of float, optional
+            The horizontal and vertical perspective tilt, small values such as 0.1. Default is none.
+        brightness : float, optional
+            The overall brightness gain. Default is 1.0.
+        gradient : float, optional
+            The change in brightness from one side of the image to the other. Default is 0.0.
+        noise : float, optional
+            The standard deviation of the added Gaussian noise in gray levels. Default is 0.0.
+        blur : int, optional
+            The kernel size of the Gaussian blur, 0 for none. Default is 0.
+        offset : tuple of float, optional
+            The shift of the board from the image center in pixels. Default is none.
+
+        Returns
+        -------
+        SyntheticFrame
+            The image and its ground truth.
+        """
+        board = np.asarray(board)
+        cells = (board == 'R').ravel() * 1 + (board == 'Y').ravel() * 2
+        self.table[:ROWS * COLS, 0] = self.palette[cells]
+
+        # Color the label map with one lookup, then warp it with smooth edges like a camera image.
+        canonical = cv2.applyColorMap(self.labels, self.table)
+        matrix = self.homography(scale, rotation, perspective, offset)
+        image = cv2.warpPerspective(canonical, matrix, (self.width, self.height), flags=cv2.INTER_LINEAR,
+                                    borderMode=cv2.BORDER_CONSTANT, borderValue=BACKGROUND_COLOR)
+
+        if brightness != 1.0 or gradient != 0.0:
+            angle = self.rng.uniform(0, 2 * np.pi)
+            gain = brightness + gradient * (np.cos(angle) * self.ramp_x + np.sin(angle) * self.ramp_y)
+            # The gain is scaled up across the interleaved channels, with 128 meaning unchanged.
+            gain = np.clip(gain * 128, 0, 255).astype(np.uint8)
+            gain = cv2.resize(gain, (self.width * 3, self.height), interpolation=cv2.INTER_LINEAR)
+            image = cv2.multiply(image.reshape(self.height, -1), gain, scale=1 / 128).reshape(image.shape)
+        if noise > 0:
+            y = int(self.rng.integers(0, self.height))
+            x = int(self.rng.integers(0, self.width))
+            field = self.noise_field[y:y + self.height, x:x + self.width]
+            image = cv2.addWeighted(image, 1.0, field, noise / 32, -128 * noise / 32)
+        if blur > 0:
+            image = cv2.GaussianBlur(image, (blur | 1, blur | 1), 0)
+
+        centers = cv2.perspectiveTransform(self.centers.reshape(-1, 1, 2), matrix).reshape(-1, 2)
+        radius = self.radius * np.sqrt(abs(np.linalg.det(matrix[:2, :2])))
+        circles = np.column_stack([centers, np.full(len(centers), radius)])
+        return SyntheticFrame(image, board.copy(), circles, matrix)
+
+    def random_frame(self, board: Optional[np.ndarray] = None) -> SyntheticFrame:
+        """
+        Draws a board, a random one if none is given, with random camera and lighting parameters.
+        """
+        rng = self.rng
+        if board is None:
+            board = random_board(rng)
+        return self.render(board, scale=rng.uniform(0.95, 1.05), rotation=rng.uniform(-3, 3),
+                           perspective=rng.uniform(-0.05, 0.05, 2), brightness=rng.uniform(0.8, 1.2),
+                           gradient=rng.uniform(0, 0.3), noise=rng.uniform(0, 6),
+                           blur=int(rng.choice([0, 3, 5])), offset=rng.uniform(-20, 20, 2))
+
+    def frames(self, count: int) -> Iterator[SyntheticFrame]:
+        """
+        Yields count random frames.
+        """
+        for _ in range(count):
+            yield self.random_frame()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Generate synthetic Connect 4 board images.')
+    parser.add_argument('--count', type=int, default=1000, help='the number of frames to generate')
+    parser.add_argument('--seed', type=int, default=None, help='the random seed')
+    parser.add_argument('--width', type=int, default=800, help='the image width')
+    parser.add_argument('--height', type=int, default=600, help='the image height')
+    parser.add_argument('--radius', type=int, default=33, help='the hole radius in pixels')
+    parser.add_argument('-o', '--output', help='write the images and a labels.jsonl file to this directory')
+    args = parser.parse_args(argv)
+
+    renderer = BoardRenderer(args.width, args.height, args.radius, seed=args.seed)
+    labels = None
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        labels = open(os.path.join(args.output, 'labels.jsonl'), 'w')
+    start = time.perf_counter()
+    try:
+        for idx, frame in enumerate(renderer.frames(args.count)):
+            if labels is not None:
+                name = 'synthetic_%06d.png' % idx
+                cv2.imwrite(os.path.join(args.output, name), frame.image)
+                labels.write(json.dumps({'image': name, 'board': frame.board.tolist(),
+                                         'circles': frame.circles.tolist()}) + '\n')
+    finally:
+        if labels is not None:
+            labels.close()
+    elapsed = time.perf_counter() - start
+    print('%d frames in %.2f s, %.0f frames per second' % (args.count, elapsed, args.count / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,42 @@
 import cv2
 import numpy as np
+import threading
+import time
+from collections import deque
+from typing import Optional, Tuple, Union
 
 class Webcam:
     """
     A class used to represent a webcam.
 
+    In threaded mode a background thread grabs frames into a small ring buffer, so reading a
+    frame does not wait on the camera and the driver buffer does not fill with stale frames.
+
     Attributes
     ----------
     cap : cv2.VideoCapture
         The VideoCapture object used to capture video from the webcam.
+    source : int or str
+        The camera index, or a video file or stream URL.
+    api : int
+        The cv2.CAP_* capture backend, or None to pick one from the source.
+    threaded : bool
+        True if frames are captured on a background thread.
+    latest_only : bool
+        True if reading a frame returns the newest frame and skips older ones, False if frames
+        are returned in the order they were captured.
+    buffer_size : int
+        The number of frames kept in the ring buffer in threaded mode.
+    frames_captured : int
+        The number of frames read from the camera.
+    frames_delivered : int
+        The number of frames returned by get_frame() and read_frame().
+    frames_dropped : int
+        The number of captured frames that were never returned.
 
     Methods
     -------
-    __init__(self)
+    __init__(self, threaded=False, buffer_size=2, latest_only=True, source=0, api=None)
         Initializes the Webcam object.
 
     open(self)
@@ -24,18 +48,55 @@ class Webcam:
     get_frame(self)
         Returns a frame from the webcam.
 
+    read_frame(self, timeout=1.0)
+        Returns a frame from the webcam with its sequence number and capture time.
+
     __del__(self)
         Destructor that closes the webcam.
 
     """
 
     cap = None
-    
-    def __init__(self) -> None:
+    source = 0
+    api = None
+    threaded = False
+    latest_only = True
+    buffer_size = 2
+
+    frames_captured = 0
+    frames_delivered = 0
+    frames_dropped = 0
+
+    def __init__(self, threaded: bool = False, buffer_size: int = 2, latest_only: bool = True,
+                 source: Union[int, str] = 0, api: Optional[int] = None) -> None:
         """
         Initializes the Webcam object.
+
+        Parameters
+        ----------
+        threaded : bool, optional
+            If True, frames are captured on a background thread. Default is False.
+        buffer_size : int, optional
+            The number of frames kept in the ring buffer in threaded mode. Default is 2.
+        latest_only : bool, optional
+            If True, reading a frame returns the newest frame and drops older ones. Default is True.
+        source : int or str, optional
+            The camera index, or a video file or stream URL to read instead. Default is 0.
+        api : int, optional
+            The cv2.CAP_* capture backend. Default is DirectShow for camera indices and automatic
+            for files and URLs.
         """
-        pass
+        self.source = source
+        self.api = api
+        self.threaded = threaded
+        self.buffer_size = buffer_size
+        self.latest_only = latest_only
+        self.buffer = deque()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.sequence = 0
+        self.last_sequence = 0
 
     def __del__(self) -> None:
         """
@@ -52,16 +113,52 @@ class Webcam:
         bool
             True if the webcam was opened successfully, False otherwise.
         """
-        self.cap = cv2.VideoCapture(0 + cv2.CAP_DSHOW)
+        api = self.api
+        if api is None:
+            api = cv2.CAP_DSHOW if isinstance(self.source, int) else cv2.CAP_ANY
+        self.cap = cv2.VideoCapture(self.source, api)
         if not self.cap.isOpened():
             return False
+        if self.threaded:
+            self.running = True
+            self.thread = threading.Thread(target=self.capture_loop, daemon=True)
+            self.thread.start()
         return True
 
     def close(self) -> None:
         """
         Closes the webcam.
         """
-        self.cap.release()
+        self.running = False
+        if self.thread is not None:
+            with self.condition:
+                self.condition.notify_all()
+            self.thread.join()
+            self.thread = None
+        if self.cap is not None:
+            self.cap.release()
+
+    def capture_loop(self) -> None:
+        """
+        Reads frames from the webcam into the ring buffer until the webcam is closed.
+        """
+        while self.running:
+            ok, frame = self.cap.read()
+            timestamp = time.monotonic()
+            if not ok:
+                # Stop rather than spin if the camera has gone away.
+                break
+            with self.condition:
+                self.sequence += 1
+                self.frames_captured += 1
+                if len(self.buffer) == self.buffer_size:
+                    self.buffer.popleft()
+                    self.frames_dropped += 1
+                self.buffer.append((frame, self.sequence, timestamp))
+                self.condition.notify_all()
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
 
     def get_frame(self) -> np.ndarray:
         """
@@ -72,6 +169,49 @@ class Webcam:
         numpy.ndarray
             A frame from the webcam.
         """
+        if self.threaded:
+            return self.read_frame()[0]
         _, frame = self.cap.read()
+        self.frames_captured += 1
+        self.frames_delivered += 1
         return frame
-    
\ No newline at end of file
+
+    def read_frame(self, timeout: float = 1.0) -> Tuple[Optional[np.ndarray], int, float]:
+        """
+        Returns a frame from the webcam with its sequence number and capture time.
+
+        In threaded mode this waits until a frame that has not been returned before is available.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum time to wait for a new frame in seconds. Default is 1.0.
+
+        Returns
+        -------
+        tuple of (numpy.ndarray, int, float)
+            The frame, its sequence number starting at 1, and its time.monotonic() capture time.
+            The frame is None if no new frame arrived before the timeout.
+        """
+        if not self.threaded:
+            ok, frame = self.cap.read()
+            timestamp = time.monotonic()
+            self.sequence += 1
+            self.frames_captured += 1
+            self.frames_delivered += 1
+            return (frame if ok else None), self.sequence, timestamp
+
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.buffer or not self.running, timeout):
+                return None, self.last_sequence, time.monotonic()
+            if not self.buffer:
+                return None, self.last_sequence, time.monotonic()
+            if self.latest_only:
+                self.frames_dropped += len(self.buffer) - 1
+                frame, sequence, timestamp = self.buffer.pop()
+                self.buffer.clear()
+            else:
+                frame, sequence, timestamp = self.buffer.popleft()
+            self.last_sequence = sequence
+            self.frames_delivered += 1
+        return frame, sequence, timestamp